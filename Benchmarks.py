@@ -0,0 +1,419 @@
+# Benchmarks.py
+"""
+Micro-benchmarks for hot paths. Run one with:
+
+    python Benchmarks.py score-frame
+    python Benchmarks.py trend-chart
+    python Benchmarks.py pdf
+    python Benchmarks.py image
+    python Benchmarks.py docx
+    python Benchmarks.py mongo-profiles --uri mongodb://localhost:27017
+    python Benchmarks.py hedge
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+def _timed(fn, *args, repeat: int = 3) -> float:
+    """Best-of-`repeat` wall time in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+# --- score-frame ---
+def _fake_history(n: int) -> list[dict]:
+    rng = random.Random(n)
+    start = datetime(2024, 1, 1)
+    docs = []
+    for i in range(n):
+        scores = {k: rng.randint(0, 5) for k in ("content", "organization", "language", "communicative")}
+        scores["total_out_of_20"] = sum(scores.values())
+        doc = {"timestamp": start + timedelta(hours=i)}
+        if i % 4 == 3:
+            doc["self_test"] = {"scores": scores}
+        else:
+            doc["suggestions"] = {"essay_score": {"scores": scores}}
+        docs.append(doc)
+    return docs
+
+def _legacy_score_frame(df):
+    """The previous iterrows + per-row pd.concat builder, kept for comparison."""
+    import pandas as pd
+    out = pd.DataFrame()
+    for _, entry in df.iterrows():
+        s = entry.get("suggestions")
+        s = (s if isinstance(s, dict) else {}).get("essay_score", {}).get("scores", {})
+        ts = entry["timestamp"]
+        for key, label in [("content", "Content"), ("organization", "Organization"),
+                           ("language", "Language"), ("communicative", "Communicative"),
+                           ("total_out_of_20", "Total(20)")]:
+            if key in s:
+                out = pd.concat([out, pd.DataFrame([{"Timestamp": ts, "Category": label, "Score": s[key]}])],
+                                ignore_index=True)
+    return out
+
+def bench_score_frame(sizes=(100, 1_000, 10_000, 50_000), legacy_max: int = 2_000) -> None:
+    import pandas as pd
+    from Data_Visualization import build_score_frame
+
+    print(f"{'attempts':>9} {'vectorized ms':>14} {'legacy ms':>10}")
+    for n in sizes:
+        df = pd.DataFrame(_fake_history(n))
+        fast = _timed(build_score_frame, df)
+        slow = _timed(_legacy_score_frame, df, repeat=1) if n <= legacy_max else None
+        print(f"{n:>9} {fast:>14.1f} {('%.1f' % slow) if slow is not None else 'skipped':>10}")
+
+# --- trend-chart ---
+def _raw_trend_json(history) -> str:
+    """The previous chart: every attempt of every lens sent to plotly."""
+    import plotly.express as px
+    from Data_Visualization import build_score_frame
+    fig = px.line(build_score_frame(history), x="Timestamp", y="Score", color="Category", markers=True)
+    return fig.to_json()
+
+def bench_trend_chart(sizes=(100, 1_000, 10_000, 50_000), hours_apart: float = 6.0) -> None:
+    import json
+    from Data_Visualization import scores_trend_figure_json
+    _raw_trend_json(_fake_history(10))  # import plotly outside the timings
+
+    print(f"{'attempts':>9} {'raw pts':>8} {'raw KB':>7} {'raw ms':>7} {'resolution':>21} {'pts':>5} {'KB':>5} {'ms':>6}")
+    for n in sizes:
+        history = _fake_history(n)
+        for doc in history:  # spread attempts out so long histories span years
+            doc["timestamp"] = datetime(2020, 1, 1) + (doc["timestamp"] - datetime(2024, 1, 1)) * hours_apart
+        raw = _raw_trend_json(history)
+        raw_ms = _timed(_raw_trend_json, history, repeat=1)
+        small, resolution = scores_trend_figure_json(history, "bench")
+        ms = _timed(scores_trend_figure_json, history, "bench", repeat=1)
+        pts = lambda js: sum(len(t["x"]) for t in json.loads(js)["data"])
+        print(f"{n:>9} {pts(raw):>8} {len(raw) // 1024:>7} {raw_ms:>7.0f} {resolution:>21} "
+              f"{pts(small):>5} {len(small) // 1024:>5} {ms:>6.0f}")
+
+# --- pdf ---
+def _make_pdf(n_pages: int, lines_per_page: int = 40) -> bytes:
+    """Minimal multi-page text PDF (Helvetica), enough for PyPDF2 extraction."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(n_pages):
+        body = "BT /F1 10 Tf 50 780 Td 12 TL " + " ".join(
+            f"(Page {p + 1} line {i + 1}: The quick brown fox jumps over the lazy dog.) '"
+            for i in range(lines_per_page)) + " ET"
+        objs.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {n_pages} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+def _legacy_pdf_text(data: bytes) -> str:
+    """The previous sequential extract-then-join path, kept for comparison."""
+    import io
+    import PyPDF2
+    from File_handling import _clean_text
+    texts = []
+    for page in PyPDF2.PdfReader(io.BytesIO(data)).pages:
+        t = page.extract_text()
+        if t:
+            texts.append(t)
+    return _clean_text("\n".join(texts))
+
+def bench_pdf(sizes=(1, 20, 200)) -> None:
+    from File_handling import _clean_text, iter_pdf_pages, PDF_WORKERS
+    print(f"workers={PDF_WORKERS}")
+    print(f"{'pages':>6} {'sequential ms':>14} {'streamed ms':>12} {'first page ms':>14}")
+    list(iter_pdf_pages(_make_pdf(40)))  # warm the pool outside the timings
+    for n in sizes:
+        data = _make_pdf(n)
+        seq = _timed(_legacy_pdf_text, data)
+        new = _timed(lambda d: _clean_text("\n".join(iter_pdf_pages(d))), data)
+        t0 = time.perf_counter()
+        next(iter_pdf_pages(data))
+        first = (time.perf_counter() - t0) * 1000
+        print(f"{n:>6} {seq:>14.1f} {new:>12.1f} {first:>14.1f}")
+
+# --- image ---
+def _make_photo(width: int, height: int) -> bytes:
+    """Phone-like JPEG: noisy paper texture with dark 'handwriting' strokes."""
+    import io
+    from PIL import Image, ImageDraw, ImageFilter
+    rng = random.Random(width * height)
+    img = Image.effect_noise((width, height), 24).convert("RGB")
+    img = Image.blend(img, Image.new("RGB", img.size, (235, 228, 210)), 0.7)
+    draw = ImageDraw.Draw(img)
+    for y in range(120, height - 120, max(40, height // 40)):
+        x = 100
+        while x < width - 200:
+            w = rng.randint(30, 140)
+            draw.line([(x, y + rng.randint(-6, 6)), (x + w, y + rng.randint(-6, 6))],
+                      fill=(30, 30, 60), width=max(3, width // 900))
+            x += w + rng.randint(15, 40)
+    img = img.filter(ImageFilter.GaussianBlur(0.6))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+class _Upload:
+    """Just enough of Streamlit's UploadedFile for File_handling."""
+    def __init__(self, data: bytes, name: str):
+        import io
+        self._buf, self.name, self.size = io.BytesIO(data), name, len(data)
+    def read(self, *a):
+        return self._buf.read(*a)
+    def seek(self, *a):
+        return self._buf.seek(*a)
+    def tell(self):
+        return self._buf.tell()
+    def getvalue(self):
+        return self._buf.getvalue()
+
+def _legacy_image_payload(data: bytes) -> int:
+    """Old path: full-res PIL image, which the Gemini SDK sends as lossless WebP."""
+    import io
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="webp", lossless=True)
+    return len(buf.getvalue())
+
+def bench_image(sizes=((1600, 1200), (3000, 4000), (4000, 3000))) -> None:
+    from File_handling import read_file_content, to_model_part
+    print(f"{'photo':>10} {'upload KB':>10} {'old KB':>8} {'old ms':>8} {'new KB':>8} {'new ms':>8}")
+    for w, h in sizes:
+        data = _make_photo(w, h)
+        t0 = time.perf_counter()
+        old_bytes = _legacy_image_payload(data)
+        old_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        img, _ = read_file_content(_Upload(data, "essay.jpg"))
+        new_bytes = len(to_model_part(img)["data"])
+        new_ms = (time.perf_counter() - t0) * 1000
+        print(f"{w}x{h:<5} {len(data) / 1024:>10.0f} {old_bytes / 1024:>8.0f} {old_ms:>8.0f} "
+              f"{new_bytes / 1024:>8.0f} {new_ms:>8.0f}")
+
+# --- docx ---
+def _make_docx(n_paragraphs: int, media_kb: int = 2048) -> bytes:
+    """Minimal .docx: n paragraphs (runs, tabs, breaks), a header and an embedded 'photo'."""
+    import io
+    import zipfile
+    w = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    paras = "".join(
+        f"<w:p><w:r><w:t xml:space=\"preserve\">Paragraph {i + 1}: The quick brown fox </w:t></w:r>"
+        f"<w:r><w:tab/><w:t>jumps over the lazy dog.</w:t><w:br/><w:t>Second line.</w:t></w:r></w:p>"
+        + ("<w:p/>" if i % 5 == 4 else "")
+        for i in range(n_paragraphs))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", "<Types/>")
+        zf.writestr("word/header1.xml", f"<w:hdr {w}><w:p><w:r><w:t>Student 42</w:t></w:r></w:p></w:hdr>")
+        zf.writestr("word/document.xml", f"<w:document {w}><w:body>{paras}</w:body></w:document>")
+        zf.writestr("word/media/image1.jpeg", random.Random(n_paragraphs).randbytes(media_kb * 1024),
+                    compress_type=zipfile.ZIP_STORED)
+    return buf.getvalue()
+
+def bench_docx(sizes=(100, 2_000, 20_000)) -> None:
+    import io
+    import docx2txt
+    from File_handling import _clean_text, iter_clean_lines, iter_docx_paragraphs
+    legacy = lambda d: _clean_text(docx2txt.process(io.BytesIO(d)))
+    capped = lambda d: "\n".join(iter_clean_lines(iter_docx_paragraphs(d)))
+    full = lambda d: "\n".join(iter_clean_lines(iter_docx_paragraphs(d), max_chars=sys.maxsize))
+    print(f"{'paragraphs':>10} {'docx2txt ms':>12} {'streamed ms':>12} {'uncapped ms':>12} {'same text':>10}")
+    for n in sizes:
+        data = _make_docx(n)
+        same = legacy(data) == full(data)
+        print(f"{n:>10} {_timed(legacy, data):>12.1f} {_timed(capped, data):>12.1f} "
+              f"{_timed(full, data):>12.1f} {str(same):>10}")
+
+# --- mongo-profiles ---
+BENCH_DB = "essay_assistant_bench"
+
+def _seed_performance_db(db, users: int = 200, per_user: int = 60) -> None:
+    """Users with suggestion/self-test history shaped like the real documents."""
+    from Migrations import run_migrations
+    run_migrations(db)
+    if db["user_performance"].estimated_document_count() >= users * per_user:
+        return
+    for name in ("user_performance", "user_analysis", "user_rollups"):
+        db[name].drop()
+    run_migrations(db)
+    rng = random.Random(7)
+    feedback = "The essay addresses the task but paragraphs need clearer topic sentences. " * 12
+    start = datetime(2024, 1, 1)
+    for u in range(users):
+        username = f"bench{u}"
+        docs = _fake_history(per_user)
+        for i, doc in enumerate(docs):
+            doc["username"] = username
+            doc["timestamp"] = start + timedelta(hours=i * 7 + rng.randint(0, 6))
+            if "suggestions" in doc:
+                block = doc["suggestions"].pop("essay_score")
+                doc["suggestions"]["essay_evaluation"] = {**block, "type_of_essay": "Article",
+                                                          "feedback": feedback, "rewrite": feedback * 2}
+            else:
+                doc["self_test"].update({"intended": {"part": "Part 3", "type": "Article"}, "feedback": feedback})
+        db["user_performance"].insert_many(docs, ordered=False)
+        db["user_analysis"].insert_one({"username": username, "user_info": {"summary": feedback}})
+        db["user_rollups"].insert_one({"_id": username, "count": per_user, "last_totals": []})
+
+def _performance_page_load(db, username: str) -> None:
+    """The reads pages/5_Performance.py makes for one visit."""
+    list(db["user_performance"].find(
+        {"username": username},
+        {"_id": 0, "timestamp": 1, "suggestions.essay_score.scores": 1,
+         "suggestions.essay_evaluation.scores": 1, "self_test.scores": 1},
+    ).sort("timestamp", -1).limit(500))
+    flt = {"username": username, "suggestions": {"$exists": True}}
+    db["user_performance"].count_documents(flt)
+    page = list(db["user_performance"].find(flt, {"timestamp": 1}).sort("timestamp", -1).limit(20))
+    if page:
+        db["user_performance"].find_one({"_id": page[0]["_id"]}, {"suggestions": 1})
+    db["user_analysis"].find_one({"username": username}, sort=[("_id", -1)])
+    db["user_rollups"].find_one({"_id": username})
+
+def bench_mongo_profiles(uri: str = "mongodb://localhost:27017", sessions: int = 32,
+                         seconds: float = 10.0, users: int = 200) -> None:
+    import threading
+    from pymongo import MongoClient
+    from Mongo_profile import BENCH_PROFILES, client_options, merge_profile
+
+    seed = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    _seed_performance_db(seed[BENCH_DB], users=users)
+    seed.close()
+
+    print(f"sessions={sessions} seconds={seconds:g} users={users}")
+    print(f"{'profile':<18} {'compressor':<11} {'pool':>5} {'loads/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'errors':>6}")
+    for label, overrides in BENCH_PROFILES.items():
+        opts = {} if overrides is None else client_options(merge_profile(overrides))
+        client = MongoClient(uri, **opts)
+        client.admin.command("ping")
+        db = client[BENCH_DB]
+        latencies, errors, lock = [], [0], threading.Lock()
+        stop_at = time.perf_counter() + seconds
+
+        def session(i: int) -> None:
+            rng = random.Random(i)
+            while time.perf_counter() < stop_at:
+                t0 = time.perf_counter()
+                try:
+                    _performance_page_load(db, f"bench{rng.randrange(users)}")
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        client.close()
+
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else float("nan")
+        compressor = opts.get("compressors") or "none"
+        print(f"{label:<18} {compressor:<11} {opts.get('maxPoolSize', 100):>5} {len(latencies) / seconds:>8.1f} "
+              f"{pct(0.5):>7.1f} {pct(0.95):>7.1f} {errors[0]:>6}")
+
+# --- hedge ---
+class _StubProvider:
+    """Sleeps for a sampled latency (ms), then returns a fixed JSON reply."""
+    def __init__(self, name: str, sample, seed: int):
+        self.name, self.metric, self.sample = name, f"stub:{name}", sample
+        self._rng, self._lock = random.Random(seed), __import__("threading").Lock()
+
+    def generate(self, contents, **_):
+        from Health import timed
+        from Llm_client import Reply
+        with self._lock:
+            ms = self.sample(self._rng)
+        with timed(self.metric):
+            time.sleep(ms / 1000)
+        return Reply('{"scores": {"content": 4, "organization": 3, "language": 4, "communicative": 3}}', self.name)
+
+def _heavy_tail(rng) -> float:
+    # mostly ~40 ms, 8% of calls stall 10-20x
+    return rng.uniform(300, 800) if rng.random() < 0.08 else rng.lognormvariate(3.6, 0.25)
+
+def bench_hedge(requests: int = 400, concurrency: int = 8) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+    import Llm_client
+    from Llm_client import HedgedModel, hedge_stats
+    from Scoring import score_json
+
+    Llm_client.HEDGE_FLOOR_S = 0.0  # stub latencies are ~100x shorter than real model calls
+
+    def run(model) -> list[float]:
+        def one(_):
+            t0 = time.perf_counter()
+            score_json(model, ["essay"], scores_path=("scores",))
+            return (time.perf_counter() - t0) * 1000
+        with ThreadPoolExecutor(concurrency) as pool:
+            return sorted(pool.map(one, range(requests)))
+
+    class _Unhedged:
+        def __init__(self, provider):
+            self.provider, self.metric_name = provider, "stub:unhedged"
+        def generate_content(self, contents, **kw):
+            return self.provider.generate(contents, **kw)
+
+    secondary = lambda rng: rng.lognormvariate(4.1, 0.2)  # ~60 ms, rarely stalls
+    plain = run(_Unhedged(_StubProvider("primary", _heavy_tail, 1)))
+    primary = _StubProvider("primary-h", _heavy_tail, 1)
+    hedged_model = HedgedModel(primary, _StubProvider("secondary", secondary, 2))
+    # warm the primary's histogram so the p95 deadline is in effect, then measure
+    run(_Unhedged(primary))
+    hedged = run(hedged_model)
+
+    pct = lambda xs, p: xs[min(len(xs) - 1, int(p * len(xs)))]
+    print(f"requests={requests} concurrency={concurrency} hedge deadline={hedged_model.hedge_deadline():.2f}s")
+    print(f"{'':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, xs in (("primary", plain), ("hedged", hedged)):
+        print(f"{label:>10} {pct(xs, .5):>8.1f} {pct(xs, .95):>8.1f} {pct(xs, .99):>8.1f}")
+    print(hedge_stats())
+
+BENCHMARKS = {
+    "score-frame": bench_score_frame,
+    "trend-chart": bench_trend_chart,
+    "pdf": bench_pdf,
+    "image": bench_image,
+    "docx": bench_docx,
+    "mongo-profiles": bench_mongo_profiles,
+    "hedge": bench_hedge,
+}
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("name", choices=sorted(BENCHMARKS))
+    ap.add_argument("--uri", default="mongodb://localhost:27017", help="mongo-profiles: server to benchmark")
+    ap.add_argument("--sessions", type=int, default=32, help="mongo-profiles: concurrent page visitors")
+    ap.add_argument("--seconds", type=float, default=10.0, help="mongo-profiles: run time per profile")
+    args = ap.parse_args(argv)
+    if args.name == "mongo-profiles":
+        bench_mongo_profiles(args.uri, sessions=args.sessions, seconds=args.seconds)
+    else:
+        BENCHMARKS[args.name]()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
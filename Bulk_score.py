@@ -0,0 +1,228 @@
+# Bulk_score.py
+"""
+Score a whole folder of essays offline with the Essay Suggestion prompt.
+
+    python Bulk_score.py essays/5A --uri mongodb://... --username "5A-{stem}"
+
+Every supported file (txt, docx, pdf, jpg, png) is read with
+File_handling.read_file_content, scored by `--concurrency` parallel model
+calls and saved to `user_performance` in the same shape the Essay
+Suggestion page saves, via insert_many. Progress goes to a JSONL checkpoint
+(default <folder>/.bulk_score.jsonl), so an interrupted run picks up where
+it stopped: scored files are not scored again and saved files are not saved
+twice. `--stub` swaps Gemini for a deterministic local model and
+`--dry-run` skips the database, which is enough to exercise a run end to end.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from Essay_suggestion import SYSTEM_PROMPT, score_essay
+from File_handling import read_file_content
+
+DEFAULT_MODEL = "gemini-2.5-flash"   # same default as Connection.DEFAULT_MODEL
+EXTENSIONS = {".txt", ".doc", ".docx", ".pdf", ".jpg", ".jpeg", ".png"}
+CHECKPOINT_NAME = ".bulk_score.jsonl"
+ROLLUP_COLLECTION = "user_rollups"   # Rollups.ROLLUP_COLLECTION
+
+# --- Models ---
+class StubModel:
+    """Deterministic stand-in for a GenerativeModel: scores derived from the essay's hash."""
+    model_name = "stub"
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+
+    def generate_content(self, contents, **_):
+        blob = json.dumps([c if isinstance(c, str) else len(c.get("data", b"")) for c in contents])
+        rng = random.Random(hashlib.sha256(blob.encode("utf-8")).hexdigest())
+        time.sleep(self.delay_s)
+        scores = {k: rng.randint(1, 5) for k in ("content", "organization", "language", "communicative")}
+        reply = {"essay_evaluation": {"part": "Part 3", "type_of_essay": "Article", "scores": scores,
+                                      "feedback": [], "summary_comment": "Stub evaluation.", "next_focus": []}}
+        return type("StubReply", (), {"text": json.dumps(reply)})()
+
+def gemini_model(model_name: str, api_key: str):
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name, system_instruction=SYSTEM_PROMPT)
+
+# --- Checkpoint ---
+class Checkpoint:
+    """Append-only JSONL log; the latest line per (file, sha256) wins."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict[tuple[str, str], dict] = {}
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut off by the interruption
+                    key = (rec["file"], rec["sha256"])
+                    self.entries[key] = {**self.entries.get(key, {}), **rec}
+        self._lock = threading.Lock()
+        self._f = path.open("a", encoding="utf-8")
+
+    def get(self, file: str, sha: str) -> dict:
+        return self.entries.get((file, sha), {})
+
+    def write(self, rec: dict) -> None:
+        with self._lock:
+            key = (rec["file"], rec["sha256"])
+            self.entries[key] = {**self.entries.get(key, {}), **rec}
+            self._f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+# --- Scoring ---
+class _File(io.BytesIO):
+    """Bytes plus the `name` read_file_content dispatches on."""
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name, self.size = name, len(data)
+
+def _score_file(model, path: Path, data: bytes, *, retries: int, timeout_s: float) -> dict:
+    content, ftype = read_file_content(_File(data, path.name))
+    if ftype == "unsupported":
+        return {"status": "unsupported", "error": content}
+    for attempt in range(retries + 1):
+        try:
+            eval_data = score_essay(model, content, "{}", request_options={"timeout": timeout_s})
+        except Exception as e:
+            if attempt == retries:
+                return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            time.sleep(2 ** attempt)
+            continue
+        if eval_data is None:
+            return {"status": "error", "error": "no parseable JSON in the model reply"}
+        return {"status": "ok", "eval": eval_data}
+
+def _doc_id(sha: str, username: str) -> str:
+    # deterministic, so re-saving after an interruption hits a duplicate key instead of a second copy
+    return "bulk-" + hashlib.sha256(f"{username}\0{sha}".encode("utf-8")).hexdigest()[:32]
+
+def performance_doc(rec: dict) -> dict:
+    return {
+        "_id": _doc_id(rec["sha256"], rec["username"]),
+        "username": rec["username"],
+        "suggestions": {"essay_evaluation": rec["eval"]},
+        "timestamp": datetime.now(),
+        "bulk_file": rec["file"],
+    }
+
+def save_batch(db, ckpt: Checkpoint, recs: list[dict]) -> int:
+    """insert_many the scored records; returns how many were newly stored."""
+    from pymongo.errors import BulkWriteError
+    if not recs:
+        return 0
+    inserted = len(recs)
+    try:
+        db["user_performance"].insert_many([performance_doc(r) for r in recs], ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        inserted -= len(errors)  # duplicates: saved by an earlier, interrupted run
+    # stale rollups are dropped and rebuilt from history on the next Performance visit
+    db[ROLLUP_COLLECTION].delete_many({"_id": {"$in": sorted({r["username"] for r in recs})}})
+    for r in recs:
+        ckpt.write({"file": r["file"], "sha256": r["sha256"], "saved": True})
+    return inserted
+
+# --- CLI ---
+def run(args) -> dict:
+    folder = Path(args.folder)
+    files = sorted(p for p in folder.rglob("*") if p.is_file() and p.suffix.lower() in EXTENSIONS)
+    ckpt = Checkpoint(Path(args.checkpoint) if args.checkpoint else folder / CHECKPOINT_NAME)
+    model = StubModel(args.stub_delay) if args.stub else gemini_model(args.model, args.api_key)
+    db = None
+    if not args.dry_run:
+        from pymongo import MongoClient
+        db = MongoClient(args.uri, serverSelectionTimeoutMS=10_000)[args.db]
+
+    counts = {"files": len(files), "scored": 0, "resumed": 0, "saved": 0, "failed": 0, "unsupported": 0}
+    to_save: list[dict] = []
+    work = []
+    for p in files:
+        data = p.read_bytes()
+        rel, sha = p.relative_to(folder).as_posix(), hashlib.sha256(data).hexdigest()
+        prev = ckpt.get(rel, sha)
+        if prev.get("status") == "ok":
+            counts["resumed"] += 1
+            if not prev.get("saved") and db is not None:
+                to_save.append(prev)
+            continue
+        work.append((p, rel, sha, data))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {pool.submit(_score_file, model, p, data, retries=args.retries, timeout_s=args.timeout): (rel, sha, p)
+                   for p, rel, sha, data in work}
+        for fut in as_completed(futures):
+            rel, sha, p = futures[fut]
+            result = fut.result()
+            rec = {"file": rel, "sha256": sha, "username": args.username.format(stem=p.stem, name=p.name),
+                   "at": datetime.now().isoformat(timespec="seconds"), **result}
+            ckpt.write(rec)
+            if result["status"] == "ok":
+                counts["scored"] += 1
+                if db is not None:
+                    to_save.append(rec)
+            else:
+                counts["failed" if result["status"] == "error" else "unsupported"] += 1
+                print(f"  {result['status']}: {rel}: {result['error']}", file=sys.stderr)
+            if db is not None and len(to_save) >= args.batch_size:
+                counts["saved"] += save_batch(db, ckpt, to_save)
+                to_save = []
+            done = counts["scored"] + counts["failed"] + counts["unsupported"]
+            if done % 10 == 0 or done == len(work):
+                print(f"  {done}/{len(work)} scored this run", file=sys.stderr)
+    if db is not None:
+        counts["saved"] += save_batch(db, ckpt, to_save)
+    ckpt.close()
+    counts["elapsed_s"] = round(time.perf_counter() - started, 1)
+    return counts
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("folder", help="folder of essays (searched recursively)")
+    ap.add_argument("--username", default="{stem}",
+                    help="owner of each saved attempt; {stem}/{name} expand to the file's stem/name")
+    ap.add_argument("--uri", default=os.environ.get("MONGODB_URI", "mongodb://localhost:27017"))
+    ap.add_argument("--db", default="essay_assistant_db")
+    ap.add_argument("--model", default=DEFAULT_MODEL)
+    ap.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY", ""))
+    ap.add_argument("--concurrency", type=int, default=4, help="model calls in flight at once")
+    ap.add_argument("--batch-size", type=int, default=50, help="documents per insert_many")
+    ap.add_argument("--retries", type=int, default=2, help="per essay, on model/transport errors")
+    ap.add_argument("--timeout", type=float, default=60.0, help="per model call, seconds")
+    ap.add_argument("--checkpoint", help=f"JSONL progress file (default <folder>/{CHECKPOINT_NAME})")
+    ap.add_argument("--dry-run", action="store_true", help="score and checkpoint only; write nothing to MongoDB")
+    ap.add_argument("--stub", action="store_true", help="use a deterministic local model instead of Gemini")
+    ap.add_argument("--stub-delay", type=float, default=0.0, help="seconds per stub call")
+    args = ap.parse_args(argv)
+
+    if not args.stub and not args.api_key:
+        ap.error("set GOOGLE_API_KEY or pass --api-key (or use --stub)")
+    counts = run(args)
+    print(json.dumps(counts))
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
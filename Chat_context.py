@@ -0,0 +1,138 @@
+# Chat_context.py
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+
+DEFAULT_BUDGET_TOKENS = 3000       # recent turns sent verbatim
+DEFAULT_SUMMARY_TOKENS = 400       # target length of the rolling summary
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+# --- Token counting ---
+@lru_cache(maxsize=1)
+def _encoding():
+    # Optional tokenizer, imported on first use (falls back to a character estimate)
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None  # e.g. no network to fetch the BPE file
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Approximate token count (cl100k_base; ~4 chars/token if unavailable)."""
+    if not text:
+        return 0
+    enc = _encoding()
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+def _to_gemini_role(role: str) -> str:
+    return "model" if role in ("assistant", "model") else "user"
+
+def _format_turns(turns: list[dict]) -> str:
+    return "\n".join(f"{'Student' if t['role'] == 'user' else 'Coach'}: {t['content']}" for t in turns)
+
+# --- Context window ---
+class ChatContext:
+    """
+    Keeps the request for each chat turn within a token budget.
+
+    The newest turns are sent verbatim until `budget_tokens` is used up; turns
+    that fall out of the window are folded into a rolling summary by
+    `summarize_fn(previous_summary, turns) -> str`, which runs on a background
+    thread so the reply is never kept waiting for it. The system prompt is
+    passed separately as the model's system_instruction and is not counted here.
+    """
+
+    def __init__(self, summarize_fn: Callable[[str, list[dict]], str] | None = None, *,
+                 budget_tokens: int = DEFAULT_BUDGET_TOKENS,
+                 summary_tokens: int = DEFAULT_SUMMARY_TOKENS):
+        self.summarize_fn = summarize_fn
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.summarized_upto = 0          # turns[:summarized_upto] are in the summary
+        self._pending: Future | None = None
+        self._pending_upto = 0
+        self._lock = threading.Lock()
+        self.last_stats: dict = {}
+
+    def _collect_summary(self) -> None:
+        with self._lock:
+            fut = self._pending
+            if fut is None or not fut.done():
+                return
+            self._pending = None
+            try:
+                text = fut.result()
+            except Exception:
+                return  # keep the old summary; the turns will be retried later
+            if text:
+                self.summary = text.strip()
+                self.summarized_upto = self._pending_upto
+
+    def _schedule_summary(self, turns: list[dict], upto: int) -> None:
+        if self.summarize_fn is None:
+            return
+        with self._lock:
+            if self._pending is not None or upto <= self.summarized_upto:
+                return
+            folded = [dict(t) for t in turns[self.summarized_upto:upto]]
+            self._pending_upto = upto
+            self._pending = _executor.submit(self.summarize_fn, self.summary, folded)
+
+    def build(self, turns: list[dict]) -> list[dict]:
+        """
+        Return Gemini `contents` for `turns` (dicts with role/content, system
+        message excluded): optional summary preamble + newest turns in budget.
+        """
+        self._collect_summary()
+
+        summary_cost = count_tokens(self.summary)
+        remaining = max(0, self.budget_tokens - summary_cost)
+        start = len(turns)
+        used = 0
+        for i in range(len(turns) - 1, -1, -1):
+            cost = count_tokens(turns[i]["content"])
+            if used + cost > remaining and start < len(turns):
+                break  # always keep at least the newest turn
+            used += cost
+            start = i
+
+        # Fold everything that fell out of the window (off the critical path)
+        if start > self.summarized_upto:
+            self._schedule_summary(turns, start)
+
+        window = turns[start:]
+        while window and _to_gemini_role(window[0]["role"]) == "model":
+            window = window[1:]  # Gemini histories should open with a user turn
+
+        contents = []
+        if self.summary and start > 0:
+            contents.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{self.summary}"]})
+            contents.append({"role": "model", "parts": ["Noted, I will keep that in mind."]})
+        contents += [{"role": _to_gemini_role(t["role"]), "parts": [t["content"]]} for t in window]
+
+        self.last_stats = {
+            "turns_total": len(turns),
+            "turns_sent": len(window),
+            "window_tokens": used,
+            "summary_tokens": summary_cost if contents and self.summary and start > 0 else 0,
+            "summary_pending": self._pending is not None,
+        }
+        return contents
+
+def summary_prompt(previous_summary: str, turns: list[dict], *, max_tokens: int = DEFAULT_SUMMARY_TOKENS) -> str:
+    """Prompt used to fold `turns` into `previous_summary`."""
+    return (
+        f"Update the running summary of a chat between an SPM essay coach and a student. "
+        f"Keep it under {max_tokens} tokens. Keep the student's goals, essay topic/Part/Type, "
+        "drafts they shared, and advice already given. Plain text only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New turns:\n{_format_turns(turns)}"
+    )
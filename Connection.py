@@ -1,17 +1,20 @@
 # Connection.py
 
 from __future__ import annotations
+import hashlib
+from typing import TYPE_CHECKING
 import streamlit as st
 import pymongo
-from pymongo.errors import ConnectionFailure, ConfigurationError, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, ConfigurationError, PyMongoError, ServerSelectionTimeoutError
 from pymongo import MongoClient
-import google.generativeai as genai
+from Lazy_imports import lazy_import
+from Migrations import run_migrations
+from Mongo_profile import client_options, merge_profile, read_preference
 
-# Optional OpenAI support
-try:
+# SDKs are loaded on first use, not at page start
+genai = lazy_import("google.generativeai")
+if TYPE_CHECKING:
     from openai import OpenAI
-except Exception:
-    OpenAI = None  # type: ignore
 
 # --- Load Secrets ---
 def _get_secret(key: str, *, required: bool = True, default: str | None = None) -> str:
@@ -29,27 +32,49 @@ def _get_secret(key: str, *, required: bool = True, default: str | None = None)
 MONGODB_URI = _get_secret("MONGODB_URI")
 OPENAI_API_KEY = _get_secret("OPENAI_API_KEY", required=False, default="")
 GEMINI_API_KEY = _get_secret("GOOGLE_API_KEY")
+# Optional endpoint overrides, e.g. local stub servers in development
+OPENAI_BASE_URL = _get_secret("OPENAI_BASE_URL", required=False, default="")
+GEMINI_API_ENDPOINT = _get_secret("GEMINI_API_ENDPOINT", required=False, default="")
 
 # --- MongoDB Setup ---
 def ping_mongo(uri=MONGODB_URI, timeout=2000):
+    """Ping over the pooled client (see Health.check_mongo); other URIs get a throwaway client."""
+    if uri == MONGODB_URI:
+        from Health import check_mongo
+        return check_mongo()["ok"]
+    client = MongoClient(uri, serverSelectionTimeoutMS=timeout)
     try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=timeout)
         client.admin.command("ping")
         return True
-    except ServerSelectionTimeoutError:
+    except PyMongoError:
         return False
+    finally:
+        client.close()
+
+def mongo_profile() -> dict:
+    """Connection profile (see Mongo_profile.py) with any `[mongo]` secrets applied."""
+    try:
+        overrides = dict(st.secrets.get("mongo", {}))
+    except Exception:
+        overrides = {}
+    return merge_profile(overrides)
 
 @st.cache_resource(show_spinner=False)
+def get_mongo_client() -> pymongo.MongoClient:
+    """
+    The pooled client, pinged and migrated; raises if MongoDB can't be reached
+    (failures aren't cached, so the next call retries). Never calls st.stop(),
+    so health probes can report "down" instead of halting the page.
+    """
+    client = MongoClient(MONGODB_URI, **client_options(mongo_profile()))
+    client.admin.command("ping")
+    ensure_indexes(client)
+    return client
+
 def init_connection() -> pymongo.MongoClient:
+    """get_mongo_client() for pages: a failure is shown and stops the script."""
     try:
-        client = MongoClient(
-            MONGODB_URI,
-            serverSelectionTimeoutMS=15000,
-            connectTimeoutMS=15000,
-            socketTimeoutMS=20000,
-        )
-        client.admin.command("ping")
-        return client
+        return get_mongo_client()
     except (ConnectionFailure, ConfigurationError, ServerSelectionTimeoutError) as e:
         st.error("❌ Could not connect to MongoDB.")
         st.caption(f"Details: {e}")
@@ -59,37 +84,105 @@ def init_connection() -> pymongo.MongoClient:
         st.exception(e)
         st.stop()
 
+def ensure_indexes(client: pymongo.MongoClient, db_name: str = "essay_assistant_db") -> None:
+    """Apply pending index migrations (see Migrations.py); runs once per process."""
+    try:
+        problems = run_migrations(client[db_name])
+    except PyMongoError as e:
+        problems = [str(e)]
+    for p in problems:
+        st.caption(f"⚠️ MongoDB migration: {p}")
+
 def get_db(db_name: str = "essay_assistant_db"):
     return init_connection()[db_name]
 
 def get_collection(collection_name: str, db_name: str = "essay_assistant_db"):
     return get_db(db_name)[collection_name]
 
+def get_dashboard_collection(collection_name: str, db_name: str = "essay_assistant_db"):
+    """Same collection, read with the profile's dashboard read preference (may lag the primary)."""
+    pref = read_preference(mongo_profile()["dashboard_read_preference"])
+    return get_collection(collection_name, db_name).with_options(read_preference=pref)
+
 # --- Gemini ---
 @st.cache_resource(show_spinner=False)
 def get_genai_connection():
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
+        if GEMINI_API_ENDPOINT:
+            genai.configure(api_key=GEMINI_API_KEY, transport="rest",
+                            client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+        else:
+            genai.configure(api_key=GEMINI_API_KEY)
         return genai
     except Exception as e:
         st.error("❌ Failed to configure Gemini.")
         st.caption(str(e))
         st.stop()
 
-def gemini_health_check() -> bool:
+# --- Model Registry ---
+# One place to choose the model and latency budget per task.
+# Scoring tasks with a `fallback_model` are hedged to OpenAI when it is
+# configured (see Llm_client.py). Any task can be overridden from secrets, e.g.
+#   [models.self_test]
+#   model = "gemini-2.5-pro"
+#   timeout_s = 90
+#   hedge_after_s = 20
+# `context_budget_tokens` (chat) is how many tokens of recent turns are sent
+# verbatim; older turns are summarized (see Chat_context.py).
+DEFAULT_MODEL = "gemini-2.5-flash"
+FALLBACK_MODEL = "gpt-4o-mini"
+MODEL_CONFIG: dict[str, dict] = {
+    "user_analysis":    {"model": DEFAULT_MODEL, "timeout_s": 60, "fallback_model": FALLBACK_MODEL},
+    "essay_suggestion": {"model": DEFAULT_MODEL, "timeout_s": 60, "fallback_model": FALLBACK_MODEL},
+    "self_test":        {"model": DEFAULT_MODEL, "timeout_s": 60, "fallback_model": FALLBACK_MODEL},
+    "chat":             {"model": DEFAULT_MODEL, "timeout_s": 45, "context_budget_tokens": 3000},
+    "chat_summary":     {"model": DEFAULT_MODEL, "timeout_s": 30},
+}
+
+def model_config(task: str) -> dict:
+    """Registry entry for `task`, with any `[models.<task>]` secrets applied."""
+    cfg = dict(MODEL_CONFIG.get(task, {"model": DEFAULT_MODEL, "timeout_s": 60}))
     try:
-        _ = genai.GenerativeModel("gemini-1.5-flash")
-        return True
+        override = st.secrets.get("models", {}).get(task, {})
+        cfg.update({k: v for k, v in dict(override).items() if v not in (None, "")})
     except Exception:
-        return False
+        pass
+    return cfg
+
+def request_options(task: str) -> dict:
+    """Per-call options for `generate_content` (latency budget)."""
+    return {"timeout": model_config(task)["timeout_s"]}
+
+MODEL_CACHE_MAX = 256   # chat prompts embed each user's profile: one model per user otherwise
+
+@st.cache_resource(show_spinner=False, max_entries=MODEL_CACHE_MAX)
+def _build_model(task: str, model_name: str, prompt_hash: str, _system_prompt: str | None):
+    # `_system_prompt` is not hashed by Streamlit; `prompt_hash` stands in for it
+    get_genai_connection()
+    return genai.GenerativeModel(model_name, system_instruction=_system_prompt or None)
+
+def get_model(task: str, system_prompt: str | None = None):
+    """Cached GenerativeModel for (task, configured model, system prompt)."""
+    prompt_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+    return _build_model(task, model_config(task)["model"], prompt_hash, system_prompt)
+
+def gemini_health_check() -> bool:
+    """Configured and not failing every recent call (see Health.check_gemini)."""
+    from Health import check_gemini
+    return check_gemini()["ok"]
 
 # --- OpenAI ---
 @st.cache_resource(show_spinner=False)
 def get_openai_connection() -> OpenAI | None:
-    if not OPENAI_API_KEY or OpenAI is None:
+    if not OPENAI_API_KEY:
+        return None
+    # Optional OpenAI support
+    try:
+        from openai import OpenAI
+    except Exception:
         return None
     try:
-        return OpenAI(api_key=OPENAI_API_KEY)
+        return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
     except Exception as e:
         st.error("❌ Failed to connect to OpenAI.")
         st.caption(str(e))
@@ -97,9 +190,6 @@ def get_openai_connection() -> OpenAI | None:
 
 # --- Combined Report ---
 def health_report() -> dict:
-    return {
-        "mongo_connected": ping_mongo(),
-        "openai_configured": bool(OPENAI_API_KEY),
-        "gemini_configured": bool(GEMINI_API_KEY),
-        "gemini_usable": gemini_health_check(),
-    }
+    """Cached checks, latency histograms and cache/queue counters (see Health.py)."""
+    from Health import health_report as _health_report
+    return _health_report()
@@ -1,15 +1,23 @@
 # Data_Visualization.py
+from __future__ import annotations
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import matplotlib.pyplot as plt
+from Lazy_imports import lazy_import
+
+# heavy; only loaded when a chart/table is actually rendered
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+px = lazy_import("plotly.express")
 
 def display_suggestion(suggestions):
-    """Render suggestions in your historical format, but supports 4 lenses + total(20)."""
+    """
+    Render a saved suggestion: the historical `essay_score` shape or the
+    `essay_evaluation` shape the Essay Suggestion page and Bulk_score save.
+    """
+    block = suggestions.get("essay_score") or suggestions.get("essay_evaluation") or {}
     st.header("Essay Type")
-    st.write(suggestions["essay_score"]["type_of_essay"])
+    st.write(block.get("type_of_essay", "Unknown"))
 
-    scores = suggestions['essay_score']['scores']
+    scores = block.get("scores") or {}
     # Build lenses
     rows = []
     lens_map = [
@@ -19,10 +27,10 @@ def display_suggestion(suggestions):
         ("communicative","Communicative"),
     ]
     for key, label in lens_map:
-        if key in scores:
+        if isinstance(scores.get(key), (int, float)):
             rows.append({"Category": label, "Score": float(scores[key])})
 
-    df = pd.DataFrame(rows)
+    df = pd.DataFrame(rows, columns=["Category", "Score"])
     fig = px.bar(df, y='Category', x='Score', color='Score',
                  labels={'Score': 'Score (0–5)', 'Category': 'Lenses'},
                  title='SPM Lenses (0–5 each)', text='Score')
@@ -30,7 +38,7 @@ def display_suggestion(suggestions):
     st.header("Scores")
     st.plotly_chart(fig, use_container_width=True)
 
-    if "total_out_of_20" in scores:
+    if isinstance(scores.get("total_out_of_20"), (int, float)):
         st.markdown(f"**Total (out of 20):** `{int(scores['total_out_of_20'])}`")
 
     df_table = df.copy()
@@ -39,12 +47,24 @@ def display_suggestion(suggestions):
         st.dataframe(df_table, use_container_width=True, hide_index=True)
 
     st.header("Suggestions")
-    for s in suggestions["essay_score"]["essay_suggestion"]:
+    items = block.get("essay_suggestion") or block.get("feedback") or []
+    if not items:
+        st.info("No granular feedback saved.")
+    for s in items:
         with st.expander(f"Section {s.get('section','-')}"):
             st.subheader("Original Text"); st.write(s.get("original_text","—"))
+            if s.get("issue"):
+                st.subheader("Issue"); st.write(s["issue"])
             st.subheader("Suggestion");    st.write(s.get("suggestion","—"))
             st.subheader("Improved Version"); st.write(s.get("improved_version","—"))
 
+    if block.get("summary_comment"):
+        st.header("Summary"); st.write(block["summary_comment"])
+    if block.get("next_focus"):
+        st.header("Next Focus")
+        for tip in block["next_focus"]:
+            st.write(f"- {tip}")
+
 def display_user_analysis(user_analysis):
     st.header("Writing Style and Role")
     st.write(f"**Role:** {user_analysis.get('game_like_role','—')}")
@@ -72,31 +92,123 @@ def display_user_analysis(user_analysis):
     st.header("Weaknesses")
     for w in user_analysis.get("weaknesses", []): st.write(f"- {w}")
 
-def display_scores_over_time(df: pd.DataFrame, selected_username: str):
-    """df rows contain {'suggestions': {essay_score:{scores: {…}}}, 'timestamp': …}"""
-    scores_over_time = pd.DataFrame()
-    for _, entry in df.iterrows():
-        # support both old and new shapes
-        s = (entry.get('suggestions', {})
-                .get('essay_score', {})
-                .get('scores', {}))
-        ts = entry['timestamp']
-        for key, label in [("content","Content"),("organization","Organization"),
-                           ("language","Language"),("communicative","Communicative")]:
-            if key in s:
-                scores_over_time = pd.concat([scores_over_time, pd.DataFrame([{
-                    "Timestamp": ts, "Category": label, "Score": s[key]
-                }])], ignore_index=True)
-
-        if "total_out_of_20" in s:
-            scores_over_time = pd.concat([scores_over_time, pd.DataFrame([{
-                "Timestamp": ts, "Category": "Total(20)", "Score": s["total_out_of_20"]
-            }])], ignore_index=True)
-
-    if scores_over_time.empty:
-        st.info("No scores to plot yet."); return
+SCORE_CATEGORIES = [
+    ("content", "Content"),
+    ("organization", "Organization"),
+    ("language", "Language"),
+    ("communicative", "Communicative"),
+    ("total_out_of_20", "Total(20)"),
+]
+
+def _scores_of(suggestions, self_test) -> dict:
+    """Scores dict from any saved shape (essay_score / essay_evaluation / self_test)."""
+    if isinstance(suggestions, dict):
+        for key in ("essay_score", "essay_evaluation"):
+            block = suggestions.get(key)
+            if isinstance(block, dict) and isinstance(block.get("scores"), dict):
+                return block["scores"]
+    if isinstance(self_test, dict) and isinstance(self_test.get("scores"), dict):
+        return self_test["scores"]
+    return {}
+
+def _column(history, name: str) -> list:
+    if isinstance(history, pd.DataFrame):
+        return history[name].tolist() if name in history.columns else [None] * len(history)
+    return [doc.get(name) for doc in history]
+
+def build_score_frame(history) -> pd.DataFrame:
+    """
+    Long-format frame (Timestamp, Category, Score) from score history in one pass.
+    `history` is a DataFrame or a list of `user_performance` documents.
+    """
+    timestamps = _column(history, "timestamp")
+    scores = [_scores_of(s, t) for s, t in zip(_column(history, "suggestions"), _column(history, "self_test"))]
+
+    wide = pd.DataFrame.from_records(scores, columns=[k for k, _ in SCORE_CATEGORIES])
+    wide = wide.rename(columns=dict(SCORE_CATEGORIES))
+    wide["Timestamp"] = timestamps
+    long = wide.melt(id_vars="Timestamp", var_name="Category", value_name="Score")
+    long["Score"] = pd.to_numeric(long["Score"], errors="coerce")
+    long = long.dropna(subset=["Score"])
+    return long.sort_values("Timestamp", kind="stable").reset_index(drop=True)
 
-    fig = px.line(scores_over_time, x='Timestamp', y='Score', color='Category',
+# --- Trend chart data ---
+MAX_POINTS_PER_SERIES = 300   # per lens; above this, LTTB over attempts (or daily/weekly means for long spans)
+RESOLUTION_NOTES = {
+    "attempt (downsampled)": "plotted as the attempts that keep the trend's shape",
+    "day (downsampled)": "plotted as daily averages, thinned to keep the trend's shape",
+    "week (downsampled)": "plotted as weekly averages, thinned to keep the trend's shape",
+}
+
+def lttb(x, y, threshold: int):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that keep
+    the visual shape of (x, y). First and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo = hi
+        nhi = min(max(int((i + 2) * every) + 1, nlo + 1), n)
+        ax, ay = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - ax) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ay - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def downsample_scores(long: pd.DataFrame, max_points: int = MAX_POINTS_PER_SERIES):
+    """
+    (frame, resolution) with at most `max_points` per Category: raw attempts
+    if they fit, else LTTB over the finest series that is still longer than
+    `max_points`: attempts, then daily means, then weekly means. A burst of
+    attempts over a few days thus keeps `max_points` attempts rather than
+    a handful of daily means, while years of history are averaged first.
+    """
+    per_series = long.groupby("Category").size().max() if not long.empty else 0
+    if per_series <= max_points:
+        return long, "attempt"
+    series, label = long.assign(Timestamp=pd.to_datetime(long["Timestamp"])), "attempt"
+    for freq, coarser in (("D", "day"), ("W", "week")):
+        binned = (series.groupby(["Category", pd.Grouper(key="Timestamp", freq=freq)])["Score"]
+                  .mean().round(2).dropna().reset_index())
+        if binned.groupby("Category").size().max() <= max_points:
+            break  # too few bins to be worth averaging into; thin the finer series instead
+        series, label = binned, coarser
+    parts = []
+    for _, g in series.groupby("Category", sort=False):
+        x = g["Timestamp"].astype("int64").to_numpy() / 1e9
+        parts.append(g.iloc[lttb(x, g["Score"].to_numpy(), max_points)])
+    return pd.concat(parts, ignore_index=True), f"{label} (downsampled)"
+
+def scores_trend_figure_json(history, selected_username: str):
+    """
+    (plotly figure JSON, resolution) for the score trend of `history`
+    (see build_score_frame), or (None, None) with nothing to plot. The JSON
+    is what the Performance page caches per (user, data version).
+    """
+    frame, resolution = downsample_scores(build_score_frame(history))
+    if frame.empty:
+        return None, None
+    fig = px.line(frame, x='Timestamp', y='Score', color='Category',
                   labels={'Score':'Score', 'Timestamp':'Date'},
-                  title=f'Scores Over Time for {selected_username}', markers=True)
-    st.plotly_chart(fig, use_container_width=True)
+                  title=f'Scores Over Time for {selected_username}', markers=resolution == "attempt")
+    return fig.to_json(), resolution
+
+def display_trend_figure(fig_json: str | None, resolution: str | None):
+    if fig_json is None:
+        st.info("No scores to plot yet."); return
+    import plotly.io as pio
+    st.plotly_chart(pio.from_json(fig_json), use_container_width=True)
+    if resolution in RESOLUTION_NOTES:
+        st.caption(f"📉 Long history: {RESOLUTION_NOTES[resolution]}.")
+
+def display_scores_over_time(df: pd.DataFrame, selected_username: str):
+    """df rows contain {'suggestions': {essay_score:{scores: {…}}}, 'timestamp': …} or {'self_test': {scores: …}}"""
+    display_trend_figure(*scores_trend_figure_json(df, selected_username))
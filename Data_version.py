@@ -0,0 +1,37 @@
+# Data_version.py
+"""
+Per-user write versions for cached reads.
+
+The write-behind queue bumps (username, collection) after a user's documents
+are stored; readers pass `data_version(username, ...)` into their
+st.cache_data functions, so a new write misses the cache and everything else
+hits it. Versions live in this process only: writes from other processes
+(e.g. Bulk_score.py) are picked up when the cache's TTL expires.
+"""
+from __future__ import annotations
+
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_versions: Counter = Counter()   # (username, collection) -> writes seen
+
+def bump(username: str, collection: str) -> None:
+    with _lock:
+        _versions[(username, collection)] += 1
+
+def bump_docs(collection: str, docs) -> None:
+    """Bump once per user among `docs` (documents without a username are ignored)."""
+    users = {d.get("username") for d in docs if isinstance(d, dict)}
+    with _lock:
+        for u in users - {None}:
+            _versions[(u, collection)] += 1
+
+def data_version(username: str, *collections: str) -> tuple[int, ...]:
+    """Current versions of `collections` for `username`; use as a cache key argument."""
+    with _lock:
+        return tuple(_versions[(username, c)] for c in collections)
+
+def data_version_stats() -> dict:
+    with _lock:
+        return {"tracked": len(_versions), "writes": sum(_versions.values())}
@@ -1,10 +1,42 @@
 # File_handling.py
 from __future__ import annotations
 
-from typing import Tuple
-from PIL import Image, ImageOps
-import docx2txt
-import PyPDF2
+import atexit
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict, deque
+from contextlib import suppress
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, Tuple
+from Lazy_imports import lazy_import
+
+# parsers load only when a file of that type is read
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+ElementTree = lazy_import("xml.etree.ElementTree")
+PyPDF2 = lazy_import("PyPDF2")
+
+# Extraction limits
+MAX_PDF_BYTES = 25 * 1024 * 1024   # reject larger uploads outright
+MAX_PDF_PAGES = 200                # pages beyond this are ignored
+MAX_TEXT_CHARS = 400_000           # stop extracting (PDF/DOCX) once this much text is collected
+PARALLEL_MIN_PAGES = 8             # below this a process pool costs more than it saves
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+# Image preprocessing (vision payloads)
+IMAGE_MAX_DIM = 2048               # longest side; keeps handwriting legible for OCR
+IMAGE_GRAYSCALE = False            # set True to drop colour (smaller, rarely hurts OCR)
+IMAGE_JPEG_QUALITY = 85
+
+# Parsed-upload cache (shared by all pages and sessions in this process)
+PARSE_CACHE_MAX_BYTES = 128 * 1024 * 1024
 
 def _clean_text(s: str) -> str:
     """Normalize whitespace and strip trailing newlines."""
@@ -31,62 +63,340 @@ def _read_txt(uploaded_file) -> Tuple[str, str]:
         text = raw.decode("latin-1", errors="ignore")
     return _clean_text(text), "txt"
 
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_T, _W_TAB, _W_BR, _W_CR = _W + "p", _W + "t", _W + "tab", _W + "br", _W + "cr"
+_HEADER_XML = re.compile(r"word/header\d*\.xml$")
+_FOOTER_XML = re.compile(r"word/footer\d*\.xml$")
+
+def _iter_xml_paragraphs(stream) -> Iterator[str]:
+    """Paragraph texts from a WordprocessingML part, parsed incrementally."""
+    stack: list[list[str]] = []   # text boxes nest paragraphs inside paragraphs
+    for event, el in ElementTree.iterparse(stream, events=("start", "end")):
+        tag = el.tag
+        if event == "start":
+            if tag == _W_P:
+                stack.append([])
+            continue
+        if tag == _W_P:
+            yield "".join(stack.pop()) if stack else ""
+            el.clear()  # keep memory flat on long documents
+        elif stack:
+            if tag == _W_T:
+                stack[-1].append(el.text or "")
+            elif tag == _W_TAB:
+                stack[-1].append("\t")
+            elif tag in (_W_BR, _W_CR):
+                stack[-1].append("\n")
+
+def iter_docx_paragraphs(data: bytes) -> Iterator[str]:
+    """
+    Stream paragraphs out of a .docx: headers, word/document.xml, then footers.
+    Only those XML parts are decompressed; embedded media is never touched.
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        names = zf.namelist()
+        parts = ([n for n in names if _HEADER_XML.match(n)] + ["word/document.xml"]
+                 + [n for n in names if _FOOTER_XML.match(n)])
+        for name in parts:
+            with zf.open(name) as stream:
+                yield from _iter_xml_paragraphs(stream)
+
+def iter_clean_lines(chunks, *, max_chars: int = MAX_TEXT_CHARS) -> Iterator[str]:
+    """
+    Streaming equivalent of _clean_text over "\n\n".join(chunks): rstripped
+    lines, runs of blank lines collapsed to one, no leading/trailing blanks.
+    Stops once `max_chars` characters have been produced.
+    """
+    produced, started, pending_blank = 0, False, False
+    for chunk in chunks:
+        for ln in chunk.replace("\x00", "").replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+            ln = ln.rstrip()
+            if not ln.strip():
+                pending_blank = started
+                continue
+            if not started:
+                ln, started = ln.lstrip(), True
+            if pending_blank:
+                yield ""
+                pending_blank = False
+            yield ln
+            produced += len(ln) + 1
+            if produced >= max_chars:
+                return
+        pending_blank = started  # paragraph break
+
 def _read_doc_docx(uploaded_file, ext: str) -> Tuple[str, str]:
+    data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
     try:
-        text = docx2txt.process(uploaded_file)
-        return _clean_text(text or ""), ext
-    except Exception:
+        return "\n".join(iter_clean_lines(iter_docx_paragraphs(data))), ext
+    except Exception:  # corrupt parts also raise zlib.error, EOFError, ...; all mean "unreadable"
         msg = (
             "This .doc file could not be parsed. "
             "Please convert it to .docx or export as PDF/TXT and try again."
         )
         return msg, "unsupported"
 
+_pdf_pool: ProcessPoolExecutor | None = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn: safe to start from Streamlit's threaded server
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pdf_pool.shutdown, wait=False, cancel_futures=True)
+        return _pdf_pool
+
+def _discard_pdf_pool() -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+            _pdf_pool = None
+
+_worker_pdf: tuple = (None, None)   # (path, PdfReader): the worker's last document
+
+def _open_pdf(source):
+    """PdfReader over bytes, or over a path, parsed once per worker process rather than once per chunk."""
+    global _worker_pdf
+    if isinstance(source, (bytes, bytearray)):
+        return PyPDF2.PdfReader(io.BytesIO(source))
+    if _worker_pdf[0] != source:
+        _worker_pdf = (source, PyPDF2.PdfReader(source))  # reads the file into memory
+    return _worker_pdf[1]
+
+def _extract_pages(source, start: int, stop: int) -> list[str]:
+    """Cleaned text of pages [start, stop) of `source` (PDF bytes or path); runs in a worker process."""
+    reader = _open_pdf(source)
+    out = []
+    for i in range(start, stop):
+        try:
+            out.append(_clean_text(reader.pages[i].extract_text() or ""))
+        except Exception:
+            out.append("")
+    return out
+
+def _pooled_chunks(data: bytes, bounds: list[tuple[int, int]]) -> Iterator[list[str]]:
+    """
+    Chunks in order, at most PDF_WORKERS in flight: a caller that stops early
+    (max_chars) leaves no queue of chunks being extracted for nobody.
+    """
+    # workers get a temp file path, not a pickled copy of the PDF per chunk
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as fh:
+        fh.write(data)
+    pool, todo, in_flight = _get_pdf_pool(), iter(bounds), deque()
+
+    def submit_next() -> None:
+        nonlocal pool
+        bound = next(todo, None)
+        if bound is None:
+            return
+        try:
+            in_flight.append((bound, pool.submit(_extract_pages, fh.name, *bound) if pool else None))
+        except BrokenProcessPool:
+            _discard_pdf_pool()
+            pool = None
+            in_flight.append((bound, None))
+
+    for _ in range(PDF_WORKERS):
+        submit_next()
+    try:
+        while in_flight:
+            (a, b), fut = in_flight.popleft()
+            submit_next()
+            try:
+                yield fut.result() if fut else _extract_pages(data, a, b)
+            except BrokenProcessPool:
+                _discard_pdf_pool()
+                pool = None
+                yield _extract_pages(data, a, b)  # a worker died: finish this chunk in-process
+    finally:
+        for _, fut in in_flight:
+            if fut:
+                fut.cancel()
+        with suppress(OSError):
+            os.unlink(fh.name)
+
+def iter_pdf_pages(data: bytes, *, max_pages: int = MAX_PDF_PAGES, max_chars: int = MAX_TEXT_CHARS,
+                   parallel: bool = True) -> Iterator[str]:
+    """
+    Yield cleaned text page by page, in order. Long PDFs are split into page
+    chunks extracted in a process pool; pages past `max_pages` and text past
+    `max_chars` are dropped. Raises if the PDF cannot be opened.
+    """
+    n_pages = min(len(PyPDF2.PdfReader(io.BytesIO(data)).pages), max_pages)
+    if not parallel or PDF_WORKERS < 2 or n_pages < PARALLEL_MIN_PAGES:
+        chunks = iter([_extract_pages(data, 0, n_pages)]) if n_pages else iter([])
+    else:
+        size = -(-n_pages // (PDF_WORKERS * 2))  # ~2 chunks per worker
+        bounds = [(i, min(i + size, n_pages)) for i in range(0, n_pages, size)]
+        chunks = _pooled_chunks(data, bounds)
+
+    used = 0
+    try:
+        for chunk in chunks:
+            for text in chunk:
+                if not text:
+                    continue
+                if used + len(text) > max_chars:
+                    yield text[: max_chars - used]
+                    return
+                used += len(text)
+                yield text
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()  # stops submitting pooled chunks
+
 def _read_pdf(uploaded_file) -> Tuple[str, str]:
+    data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    if len(data) > MAX_PDF_BYTES:
+        return f"PDF is larger than {MAX_PDF_BYTES // (1024 * 1024)} MB. Please upload a smaller file.", "unsupported"
     try:
-        reader = PyPDF2.PdfReader(uploaded_file)
+        pages = list(iter_pdf_pages(data))
     except Exception:
         return "Unable to open PDF. The file may be encrypted or corrupted.", "unsupported"
 
-    texts = []
-    for page in getattr(reader, "pages", []) or []:
-        try:
-            t = page.extract_text()
-            if t:
-                texts.append(t)
-        except Exception:
-            continue
-
-    full_text = _clean_text("\n".join(texts))
+    full_text = _clean_text("\n".join(pages))
     return full_text, "pdf"
 
+def preprocess_image(img, *, max_dim: int | None = None, grayscale: bool | None = None):
+    """Downsize to `max_dim` on the longest side and flatten to RGB (or L); defaults: the IMAGE_* settings."""
+    max_dim = max_dim or IMAGE_MAX_DIM
+    grayscale = IMAGE_GRAYSCALE if grayscale is None else grayscale
+    if max(img.size) > max_dim:
+        img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+    if grayscale:
+        return img.convert("L")
+    if img.mode in ("RGBA", "LA", "P"):
+        rgba = img.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))  # JPEG has no alpha
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+def image_part(img, *, quality: int | None = None) -> dict:
+    """
+    JPEG inline-data part for Gemini. Without this the SDK re-encodes PIL
+    images as lossless WebP, which is far larger for photos.
+    """
+    quality = quality or IMAGE_JPEG_QUALITY
+    cached = img.info.get("jpeg_part")   # (quality, part)
+    if cached is not None and cached[0] == quality:
+        return cached[1]
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    part = {"mime_type": "image/jpeg", "data": buf.getvalue()}
+    img.info["jpeg_part"] = (quality, part)
+    stats = img.info.get("preprocess")
+    if stats is not None:
+        stats["sent_bytes"] = len(part["data"])
+    return part
+
+def to_model_part(content):
+    """Prompt part for `content` from read_file_content (images -> compact JPEG)."""
+    if hasattr(content, "save") and hasattr(content, "size"):
+        return image_part(content)
+    return content
+
 def _read_image(uploaded_file, ext: str):
+    original_bytes = getattr(uploaded_file, "size", None)
     img = Image.open(uploaded_file)
+    original_size = img.size
+    try:
+        img.draft("RGB", (IMAGE_MAX_DIM, IMAGE_MAX_DIM))  # JPEG: decode at reduced scale
+    except Exception:
+        pass
     try:
         img = ImageOps.exif_transpose(img)  # fix orientation
     except Exception:
         pass
-    if img.mode not in ("RGB", "RGBA"):
-        img = img.convert("RGB")
+    img = preprocess_image(img)
+    img.info["preprocess"] = {"original_bytes": original_bytes, "original_size": original_size,
+                              "size": img.size}
     return img, ext
 
+def _parse(uploaded_file, ext: str) -> Tuple[object, str]:
+    if ext in ("jpg", "jpeg", "png"):
+        return _read_image(uploaded_file, ext)
+    if ext == "txt":
+        return _read_txt(uploaded_file)
+    if ext in ("doc", "docx"):
+        return _read_doc_docx(uploaded_file, ext)
+    if ext == "pdf":
+        return _read_pdf(uploaded_file)
+    return "Unsupported file type", "unsupported"
+
+_parse_cache: OrderedDict[str, tuple] = OrderedDict()   # key -> (content, file_type, cost)
+_parse_cache_lock = threading.Lock()
+_parse_cache_bytes = 0
+_parse_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def _content_cost(content, raw_len: int) -> int:
+    """Approximate memory held by a cache entry."""
+    if isinstance(content, str):
+        return raw_len + len(content)
+    if hasattr(content, "size") and hasattr(content, "getbands"):
+        w, h = content.size
+        return raw_len + w * h * len(content.getbands())
+    return raw_len
+
+def _cache_put(key: str, result: Tuple[object, str], cost: int) -> None:
+    global _parse_cache_bytes
+    if cost > PARSE_CACHE_MAX_BYTES:
+        return
+    with _parse_cache_lock:
+        if key in _parse_cache:
+            return
+        _parse_cache[key] = (*result, cost)
+        _parse_cache_bytes += cost
+        while _parse_cache_bytes > PARSE_CACHE_MAX_BYTES and _parse_cache:
+            _, (_, _, old_cost) = _parse_cache.popitem(last=False)
+            _parse_cache_bytes -= old_cost
+            _parse_cache_stats["evictions"] += 1
+
+def _parse_settings() -> str:
+    """Settings that shape a parsed result; part of the cache key, so changing them misses old entries."""
+    return (f"{IMAGE_MAX_DIM}:{IMAGE_GRAYSCALE}:{IMAGE_JPEG_QUALITY}:"
+            f"{MAX_PDF_BYTES}:{MAX_PDF_PAGES}:{MAX_TEXT_CHARS}")
+
+def parse_cache_stats() -> dict:
+    with _parse_cache_lock:
+        return {**_parse_cache_stats, "entries": len(_parse_cache), "bytes": _parse_cache_bytes}
+
 def read_file_content(uploaded_file) -> Tuple[object, str]:
     """
     Returns (content, file_type)
       - text/docx/pdf -> content is str
-      - jpg/png -> content is PIL.Image
+      - jpg/png -> content is PIL.Image (downsized; send it with to_model_part)
       - unsupported -> ("Unsupported file type", "unsupported")
+
+    Results are memoized by a hash of the file's bytes and the preprocessing
+    settings (_parse_settings), so a Streamlit rerun (or the same upload on
+    another page) does not parse the file again.
+    Treat the returned content as read-only; it may be shared.
     """
     name = getattr(uploaded_file, "name", "") or ""
     ext = name.split(".")[-1].lower() if "." in name else ""
+    if ext not in ("jpg", "jpeg", "png", "txt", "doc", "docx", "pdf"):
+        return "Unsupported file type", "unsupported"
 
-    if ext in ("jpg", "jpeg", "png"):
-        return _read_image(uploaded_file, ext)
-    if ext == "txt":
-        return _read_txt(uploaded_file)
-    if ext in ("doc", "docx"):
-        return _read_doc_docx(uploaded_file, ext)
-    if ext == "pdf":
-        return _read_pdf(uploaded_file)
+    data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    key = hashlib.sha256(f"{ext}\0{_parse_settings()}\0".encode("ascii") + data).hexdigest()
+    with _parse_cache_lock:
+        hit = _parse_cache.get(key)
+        if hit is not None:
+            _parse_cache.move_to_end(key)
+            _parse_cache_stats["hits"] += 1
+            return hit[0], hit[1]
+        _parse_cache_stats["misses"] += 1
 
-    return "Unsupported file type", "unsupported"
+    buf = io.BytesIO(data)
+    buf.name, buf.size = name, len(data)
+    result = _parse(buf, ext)
+    if result[1] != "unsupported":
+        _cache_put(key, result, _content_cost(result[0], len(data)))
+    return result
@@ -0,0 +1,193 @@
+# Health.py
+"""
+Cheap health checks plus rolling latency histograms.
+
+Checks reuse the pooled client from Connection.get_mongo_client and are cached
+for HEALTH_TTL_S, so a probe costs one `ping` round trip at most every few
+seconds instead of a fresh TCP/TLS handshake and server selection.
+Model calls are timed by their callers with `timed("gemini:<model>")`.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+HEALTH_TTL_S = 15.0          # reuse a check result this long
+PING_TIMEOUT_S = 2.0         # upper bound on a ping, including server selection
+WINDOW_S = 15 * 60           # latency percentiles cover the last 15 minutes...
+WINDOW_MAX_SAMPLES = 2048    # ...or this many samples, whichever is fewer
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# --- Latency histograms ---
+class LatencyHistogram:
+    """Rolling window of (time, ms, ok) samples with percentile/bucket summaries."""
+
+    def __init__(self, *, window_s: float = WINDOW_S, max_samples: int = WINDOW_MAX_SAMPLES):
+        self.window_s = window_s
+        self._samples: deque = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.total = 0
+        self.total_errors = 0
+
+    def observe(self, ms: float, ok: bool = True) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), ms, ok))
+            self.total += 1
+            self.total_errors += not ok
+
+    def snapshot(self) -> dict:
+        """Counts, error rate, p50/p95/p99/max and bucket counts over the window."""
+        cutoff = time.monotonic() - self.window_s
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            window = list(self._samples)
+            total, total_errors = self.total, self.total_errors
+        lat = sorted(ms for _, ms, _ in window)
+        errors = sum(1 for *_, ok in window if not ok)
+        buckets = [0] * (len(BUCKETS_MS) + 1)
+        for ms in lat:
+            buckets[bisect_left(BUCKETS_MS, ms)] += 1
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+
+        def pct(p: float):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 1) if lat else None
+
+        return {
+            "count": len(lat), "errors": errors,
+            "error_rate": round(errors / len(lat), 4) if lat else 0.0,
+            "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+            "max_ms": round(lat[-1], 1) if lat else None,
+            "buckets": dict(zip(labels, buckets)),
+            "lifetime_count": total, "lifetime_errors": total_errors,
+        }
+
+_histograms: dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+def histogram(name: str) -> LatencyHistogram:
+    with _histograms_lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = LatencyHistogram()
+        return h
+
+def observe(name: str, ms: float, ok: bool = True) -> None:
+    histogram(name).observe(ms, ok)
+
+@contextmanager
+def timed(name: str):
+    """Record the wall time of the block under `name` (an exception counts as an error)."""
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        observe(name, (time.perf_counter() - started) * 1000, ok)
+
+def model_metric(model) -> str:
+    """Histogram name for a GenerativeModel's calls, e.g. 'gemini:gemini-2.5-flash'."""
+    if getattr(model, "metric_name", None):
+        return model.metric_name
+    return "gemini:" + str(getattr(model, "model_name", "unknown")).removeprefix("models/")
+
+def latency_snapshot() -> dict:
+    with _histograms_lock:
+        names = sorted(_histograms)
+    return {name: histogram(name).snapshot() for name in names}
+
+# --- Checks ---
+_cache: dict[str, tuple[float, dict]] = {}
+_cache_lock = threading.Lock()
+
+def _cached(name: str, fn, force: bool) -> dict:
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(name)
+    if hit and not force and now - hit[0] < HEALTH_TTL_S:
+        return {**hit[1], "cached": True}
+    result = fn()
+    with _cache_lock:
+        _cache[name] = (time.monotonic(), result)
+    return {**result, "cached": False}
+
+def _ping_mongo() -> dict:
+    import pymongo
+    from Connection import get_mongo_client
+    started = time.perf_counter()
+    try:
+        client = get_mongo_client()  # a first connect that fails is "down", not st.stop()
+        with pymongo.timeout(PING_TIMEOUT_S):
+            client.admin.command("ping")
+        ok, error = True, None
+    except Exception as e:
+        ok, error = False, str(e)
+    ms = (time.perf_counter() - started) * 1000
+    observe("mongo_ping", ms, ok)
+    return {"ok": ok, "latency_ms": round(ms, 1), "error": error}
+
+def check_mongo(force: bool = False) -> dict:
+    """Ping over the pooled client; cached for HEALTH_TTL_S."""
+    return _cached("mongo", _ping_mongo, force)
+
+def _gemini_status() -> dict:
+    # judged from recent real calls: constructing a model proves nothing
+    from Connection import GEMINI_API_KEY
+    recent = [s for name, s in latency_snapshot().items() if name.startswith("gemini:")]
+    calls = sum(s["count"] for s in recent)
+    errors = sum(s["errors"] for s in recent)
+    return {"ok": bool(GEMINI_API_KEY) and (calls == 0 or errors < calls),
+            "recent_calls": calls, "recent_errors": errors}
+
+def check_gemini(force: bool = False) -> dict:
+    return _cached("gemini", _gemini_status, force)
+
+def _component_stats() -> dict:
+    """Counters from the caches/queues this process owns (a failing source reports its error)."""
+    from Data_version import data_version_stats
+    from File_handling import parse_cache_stats
+    from Llm_client import hedge_stats
+    from Score_cache import get_score_cache
+    from Scoring import scoring_stats
+    from Single_flight import single_flight_stats
+    from Write_queue import get_write_queue
+    sources = {
+        "score_cache": lambda: get_score_cache().stats(),
+        "scoring": scoring_stats,
+        "write_queue": lambda: get_write_queue().stats(),
+        "parse_cache": parse_cache_stats,
+        "llm_hedge": hedge_stats,
+        "single_flight": single_flight_stats,
+        "data_version": data_version_stats,
+    }
+    out = {}
+    for name, fn in sources.items():
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {"error": str(e)}
+    return out
+
+def health_report(force: bool = False) -> dict:
+    """JSON-safe snapshot: checks, latency histograms and component counters."""
+    from Connection import GEMINI_API_KEY, OPENAI_API_KEY
+    mongo, gemini = check_mongo(force), check_gemini(force)
+    return {
+        "checked_at": datetime.now(tz=timezone.utc).isoformat(timespec="seconds"),
+        "mongo_connected": mongo["ok"],
+        "openai_configured": bool(OPENAI_API_KEY),
+        "gemini_configured": bool(GEMINI_API_KEY),
+        "gemini_usable": gemini["ok"],
+        "checks": {"mongo": mongo, "gemini": gemini},
+        "latency": latency_snapshot(),
+        "components": _component_stats(),
+    }
+
+def health_json(force: bool = False) -> str:
+    return json.dumps(health_report(force), indent=2, default=str)
@@ -0,0 +1,139 @@
+# Import_budget.py
+"""
+Cold-start import report per page (`python -X importtime` under the hood).
+
+    python Import_budget.py                 # report all pages
+    python Import_budget.py --budget-ms 900 # exit 1 if any page is over budget
+    python -m pytest tests/test_import_budget.py   # the same gate under pytest
+
+Modules are imported with stub secrets (STUB_SECRETS) so Connection and
+Authentication load completely; any import error fails the page.
+A page also fails if it eagerly imports one of EAGER_FORBIDDEN (beyond what
+`import streamlit` already loads); those must go through
+Lazy_imports.lazy_import so they load only on the code path that needs them.
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET_MS = 1500.0
+EAGER_FORBIDDEN = ("pandas", "plotly", "matplotlib", "google.generativeai", "openai",
+                   "PIL", "PyPDF2", "docx2txt", "tiktoken")
+# Enough for module-level secret lookups; nothing connects at import time
+STUB_SECRETS = {"MONGODB_URI": "mongodb://localhost:27017", "GOOGLE_API_KEY": "stub",
+                "JWT_SECRET_KEY": "stub", "OPENAI_API_KEY": ""}
+
+def page_files() -> list[str]:
+    pages = [os.path.join(ROOT, "Home.py")]
+    pages_dir = os.path.join(ROOT, "pages")
+    pages += sorted(os.path.join(pages_dir, f) for f in os.listdir(pages_dir) if f.endswith(".py"))
+    return pages
+
+def top_level_imports(path: str) -> list[str]:
+    """Modules a page imports at module level (what a cold start pays for)."""
+    with open(path, encoding="utf-8") as fh:
+        tree = ast.parse(fh.read(), filename=path)
+    mods = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            mods += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            mods.append(node.module)
+    return list(dict.fromkeys(mods))
+
+def measure(modules: list[str]) -> dict:
+    """Import `modules` in a fresh interpreter and report cumulative cost and import errors."""
+    script = (
+        "import sys\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        "errors = []\n"
+        f"for m in {modules!r}:\n"
+        "    try:\n"
+        "        __import__(m)\n"
+        "    except BaseException as e:\n"   # includes st.stop() outside a Streamlit run
+        "        errors.append(f'{m}: {type(e).__name__}: {e}')\n"
+        "import json\n"
+        "print(json.dumps(errors))\n"
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        # Streamlit reads ./.streamlit/secrets.toml relative to the working directory
+        os.makedirs(os.path.join(cwd, ".streamlit"))
+        with open(os.path.join(cwd, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as fh:
+            fh.writelines(f"{k} = {json.dumps(v)}\n" for k, v in STUB_SECRETS.items())
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", script],
+                              cwd=cwd, capture_output=True, text=True)
+    try:
+        errors = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        errors = [f"interpreter exited {proc.returncode}: {proc.stderr.strip().splitlines()[-1:]}"]
+    top, loaded = [], []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cum_us = int(parts[1])
+        except ValueError:
+            continue
+        name = parts[2].rstrip()
+        loaded.append(name.strip())
+        if not name.startswith("  "):  # depth-0 rows: their cumulative covers children
+            top.append((name.strip(), cum_us))
+    total_ms = sum(us for _, us in top) / 1000
+    heaviest = sorted(top, key=lambda r: r[1], reverse=True)[:8]
+    eager = [bad for bad in EAGER_FORBIDDEN if any(m == bad or m.startswith(bad + ".") for m in loaded)]
+    return {
+        "total_ms": round(total_ms, 1),
+        "heaviest": [{"module": m, "ms": round(us / 1000, 1)} for m, us in heaviest],
+        "eager_heavy": eager,
+        "errors": errors,
+    }
+
+def framework_baseline() -> set[str]:
+    """Heavy modules Streamlit itself imports; pages cannot avoid those."""
+    return set(measure(["streamlit"])["eager_heavy"])
+
+def report(budget_ms: float = DEFAULT_BUDGET_MS) -> tuple[dict, list[str]]:
+    results, failures = {}, []
+    baseline = framework_baseline()
+    for path in page_files():
+        name = os.path.relpath(path, ROOT)
+        res = measure(top_level_imports(path))
+        res["eager_heavy"] = [m for m in res["eager_heavy"] if m not in baseline]
+        results[name] = res
+        if res["total_ms"] > budget_ms:
+            failures.append(f"{name}: {res['total_ms']}ms > budget {budget_ms}ms")
+        for err in res["errors"]:
+            failures.append(f"{name}: import failed: {err}")
+        if res["eager_heavy"]:
+            failures.append(f"{name}: eagerly imports {', '.join(res['eager_heavy'])}")
+    return results, failures
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    ap.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = ap.parse_args(argv)
+
+    results, failures = report(args.budget_ms)
+    if args.json:
+        print(json.dumps({"results": results, "failures": failures}, indent=2))
+    else:
+        for name, res in results.items():
+            top = ", ".join(f"{h['module']} {h['ms']}ms" for h in res["heaviest"][:3])
+            print(f"{name:35s} {res['total_ms']:8.1f} ms   {top}")
+        for f in failures:
+            print(f"FAIL {f}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
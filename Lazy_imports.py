@@ -0,0 +1,49 @@
+# Lazy_imports.py
+from __future__ import annotations
+
+import importlib
+import threading
+import types
+
+_lock = threading.Lock()
+
+class _LazyModule(types.ModuleType):
+    """Module stand-in that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self):
+        mod = self.__dict__["_lazy_target"]
+        if mod is None:
+            with _lock:
+                mod = self.__dict__["_lazy_target"]
+                if mod is None:
+                    mod = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_target"] = mod
+        return mod
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_target"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Return `name` as a module whose import is deferred until first use, e.g.
+        pd = lazy_import("pandas")
+        px = lazy_import("plotly.express")
+    """
+    return _LazyModule(name)
+
+def is_loaded(module) -> bool:
+    """True once a lazy module has actually been imported (real modules: always)."""
+    if isinstance(module, _LazyModule):
+        return module.__dict__["_lazy_target"] is not None
+    return True
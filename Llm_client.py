@@ -0,0 +1,191 @@
+# Llm_client.py
+"""
+Provider-agnostic scoring client with a latency hedge.
+
+`get_scoring_model(task, system_prompt)` returns something with the same
+`generate_content(contents, generation_config=..., request_options=...)`
+surface as a Gemini GenerativeModel, so Scoring.score_json works unchanged.
+When OpenAI is configured and the task has a `fallback_model`, the call goes
+to Gemini first; if it has not answered by the hedge deadline (Gemini's
+recent p95 for that model on that task), the same request is sent to OpenAI
+and whichever reply arrives first wins. A primary that fails outright fails over at once.
+Both providers are asked for JSON, so score_json normalizes either reply
+into the usual scores/feedback schema.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from Health import histogram, model_metric, timed
+
+HEDGE_MIN_SAMPLES = 20     # below this, Gemini's p95 is too noisy to trust
+HEDGE_DEFAULT_S = 15.0     # deadline until then
+HEDGE_FLOOR_S = 2.0        # never hedge sooner than this
+HEDGE_WORKERS = 16         # per leg
+
+# Separate pools: when Gemini is slow its calls fill the primary pool, and a
+# shared pool would queue the hedges behind the very calls they are rescuing.
+_primary_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-primary")
+_secondary_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-secondary")
+
+# --- Metrics ---
+_lock = threading.Lock()
+_counters = {"requests": 0, "hedges": 0, "failovers": 0, "primary_wins": 0, "secondary_wins": 0, "failures": 0}
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+def hedge_stats() -> dict:
+    """Process-wide hedge counters plus the share of requests that needed the fallback."""
+    with _lock:
+        out = dict(_counters)
+    req = out["requests"] or 1
+    out["hedge_rate"] = round(out["hedges"] / req, 4)
+    out["secondary_win_rate"] = round(out["secondary_wins"] / req, 4)
+    return out
+
+class Reply:
+    """Minimal stand-in for a GenerateContentResponse: `.text`, who answered and token usage."""
+    def __init__(self, text: str, provider: str, model_name: str = "",
+                 prompt_tokens: int | None = None, output_tokens: int | None = None):
+        self.text = text
+        self.provider = provider
+        self.model_name = model_name
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+
+# --- Providers ---
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, model, task: str | None = None):
+        self.model = model
+        # per task, so chat streams timed under the bare model name don't move the hedge deadline
+        self.metric = f"{model_metric(model)}:{task}" if task else model_metric(model)
+
+    def generate(self, contents, *, generation_config=None, request_options=None) -> Reply:
+        opts = {}
+        if generation_config:
+            opts["generation_config"] = generation_config
+        if request_options:
+            opts["request_options"] = request_options
+        with timed(self.metric):
+            resp = self.model.generate_content(contents, **opts)
+        usage = getattr(resp, "usage_metadata", None)
+        return Reply(resp.text, self.name, self.model.model_name,
+                     getattr(usage, "prompt_token_count", None) or None,
+                     getattr(usage, "candidates_token_count", None))
+
+def _openai_content(part) -> dict:
+    """One Gemini-style part as an OpenAI chat content item."""
+    if isinstance(part, dict) and "mime_type" in part and "data" in part:
+        url = f"data:{part['mime_type']};base64,{base64.b64encode(part['data']).decode('ascii')}"
+        return {"type": "image_url", "image_url": {"url": url}}
+    if hasattr(part, "size") and hasattr(part, "getbands"):  # PIL image
+        from File_handling import image_part
+        return _openai_content(image_part(part))
+    if not isinstance(part, str):
+        part = json.dumps(part, ensure_ascii=False, default=str)
+    return {"type": "text", "text": part}
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, client, model_name: str, system_prompt: str | None = None):
+        self.client = client
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.metric = f"openai:{model_name}"
+
+    def generate(self, contents, *, generation_config=None, request_options=None) -> Reply:
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        system, kwargs = self.system_prompt or "", {}
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            # json_object mode insists that the prompt itself asks for JSON
+            system = (system + "\n\nReply with a single JSON object.").strip()
+            kwargs["response_format"] = {"type": "json_object"}
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": [_openai_content(p) for p in parts]})
+        client = self.client.with_options(timeout=(request_options or {}).get("timeout", 60), max_retries=0)
+        with timed(self.metric):
+            resp = client.chat.completions.create(model=self.model_name, messages=messages, **kwargs)
+        usage = getattr(resp, "usage", None)
+        return Reply(resp.choices[0].message.content or "", self.name, self.model_name,
+                     getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None))
+
+# --- Hedging ---
+class HedgedModel:
+    """Primary provider with a deadline-triggered (or failure-triggered) secondary."""
+
+    def __init__(self, primary: GeminiProvider, secondary, *, hedge_after_s: float | None = None):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_after_s = hedge_after_s
+        # Scoring times whole calls under this name; the providers time their own legs
+        self.metric_name = f"hedged:{primary.metric}|{secondary.metric}"
+
+    def hedge_deadline(self, timeout_s: float | None = None) -> float:
+        """Seconds to wait for the primary before hedging: `hedge_after_s`, else its recent p95 (floored)."""
+        if self.hedge_after_s is not None:
+            deadline = float(self.hedge_after_s)
+        else:
+            snap = histogram(self.primary.metric).snapshot()
+            ok = snap["count"] - snap["errors"]
+            deadline = snap["p95_ms"] / 1000 if ok >= HEDGE_MIN_SAMPLES else HEDGE_DEFAULT_S
+            deadline = max(HEDGE_FLOOR_S, deadline)
+        return min(deadline, timeout_s) if timeout_s else deadline
+
+    def generate_content(self, contents, *, generation_config=None, request_options=None, stream=False):
+        if stream:  # hedging needs whole replies; stream from the primary alone
+            return self.primary.model.generate_content(contents, stream=True, generation_config=generation_config,
+                                                      request_options=request_options)
+        _count("requests")
+        call = dict(generation_config=generation_config, request_options=request_options)
+        first = _primary_executor.submit(self.primary.generate, contents, **call)
+        done, _ = wait([first], timeout=self.hedge_deadline((request_options or {}).get("timeout")))
+        if done and first.exception() is None:
+            _count("primary_wins")
+            return first.result()
+
+        _count("failovers" if done else "hedges")
+        second = _secondary_executor.submit(self.secondary.generate, contents, **call)
+        pending = {first, second} - done
+        errors = [first.exception()] if done else []
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in finished:
+                if f.exception() is None:
+                    _count("primary_wins" if f is first else "secondary_wins")
+                    return f.result()
+                errors.append(f.exception())
+        _count("failures")
+        raise errors[0]
+
+def cache_model_name(model) -> str:
+    """
+    Model identity for score-cache keys. A hedged model may answer with
+    either provider, so its name covers both; dropping or changing the
+    fallback then stops old entries from matching.
+    """
+    if isinstance(model, HedgedModel):
+        return f"{cache_model_name(model.primary.model)}|{model.secondary.name}:{model.secondary.model_name}"
+    return str(model.model_name).removeprefix("models/")
+
+def get_scoring_model(task: str, system_prompt: str | None = None):
+    """
+    Model for a scoring task: the plain Gemini model, or a HedgedModel when
+    OpenAI is configured and the task's registry entry names a fallback_model.
+    """
+    from Connection import get_model, get_openai_connection, model_config
+    model = get_model(task, system_prompt)
+    cfg = model_config(task)
+    fallback = cfg.get("fallback_model")
+    client = get_openai_connection() if fallback else None
+    if client is None:
+        return model
+    return HedgedModel(GeminiProvider(model, task), OpenAIProvider(client, fallback, system_prompt),
+                       hedge_after_s=cfg.get("hedge_after_s"))
@@ -0,0 +1,171 @@
+# Llm_metrics.py
+"""
+Per-call LLM instrumentation.
+
+Every model call made for a task records one document in the capped
+`llm_metrics` collection (created by Migrations version 4) through the
+write-behind queue:
+
+    {at, page, task, model, provider, prompt_tokens, output_tokens,
+     token_source, latency_ms, ok, parsed, error}
+
+Token counts come from the provider's usage metadata when present and are
+estimated with tiktoken (Chat_context.count_tokens) otherwise.
+`llm_call_report()` summarizes recent calls by page and model.
+"""
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from Chat_context import count_tokens
+
+METRICS_COLLECTION = "llm_metrics"
+METRICS_CAP_BYTES = 64 * 1024 * 1024
+METRICS_CAP_DOCS = 200_000
+IMAGE_TOKENS = 258            # Gemini's flat charge per image part
+REPORT_MAX_CALLS = 20_000     # newest calls scanned by the report
+
+# Which page issues each task (chat and its summaries share the chat page)
+TASK_PAGES = {
+    "user_analysis": "1_User_Analysis",
+    "essay_suggestion": "2_Essay_Suggestion",
+    "chat": "3_Essay_Writing_Chat",
+    "chat_summary": "3_Essay_Writing_Chat",
+    "self_test": "4_Self_Test",
+}
+
+# --- Token estimates ---
+def _system_text(model) -> str:
+    model = getattr(getattr(model, "primary", None), "model", model)  # HedgedModel -> Gemini model
+    inst = getattr(model, "_system_instruction", None)
+    try:
+        return "".join(p.text for p in inst.parts) if inst is not None else ""
+    except Exception:
+        return ""
+
+def _part_tokens(part) -> int:
+    if isinstance(part, str):
+        return count_tokens(part)
+    if isinstance(part, dict):
+        if "mime_type" in part and "data" in part:
+            return IMAGE_TOKENS
+        if "parts" in part:  # chat content {"role", "parts"}
+            return sum(_part_tokens(p) for p in part["parts"])
+        return count_tokens(str(part))
+    if hasattr(part, "size") and hasattr(part, "getbands"):  # PIL image
+        return IMAGE_TOKENS
+    return count_tokens(str(part))
+
+def estimate_prompt_tokens(model, contents) -> int:
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    return count_tokens(_system_text(model)) + sum(_part_tokens(p) for p in parts)
+
+def _usage(resp):
+    """
+    (prompt_tokens, output_tokens) reported by the provider, or (None, None).
+    `resp` is a response, an Llm_client.Reply, or a stream's UsageMetadata itself.
+    """
+    meta = resp if hasattr(resp, "prompt_token_count") else getattr(resp, "usage_metadata", None)
+    if meta is not None and getattr(meta, "prompt_token_count", None):
+        return meta.prompt_token_count, getattr(meta, "candidates_token_count", None) or 0
+    if getattr(resp, "prompt_tokens", None) is not None:  # Llm_client.Reply
+        return resp.prompt_tokens, resp.output_tokens or 0
+    return None, None
+
+def _model_name(model) -> str:
+    model = getattr(getattr(model, "primary", None), "model", model)
+    return str(getattr(model, "model_name", "unknown")).removeprefix("models/")
+
+# --- Recording ---
+class LlmCall:
+    """One model call in progress; `finish()` records it (once)."""
+
+    def __init__(self, task: str, model, contents):
+        self.task = task
+        self.model = model
+        self.contents = contents
+        self.started = time.perf_counter()
+        self.finished = False
+
+    def finish(self, resp=None, *, text: str | None = None, usage=None, error: BaseException | None = None,
+               parsed: bool | None = None) -> None:
+        """
+        Record the call. Pass the response object (non-streamed), or the full
+        `text` plus the last chunk's usage metadata (`usage`) for streams.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        latency_ms = (time.perf_counter() - self.started) * 1000
+        prompt_tokens, output_tokens = _usage(resp) if resp is not None else _usage(usage)
+        source = "usage"
+        if prompt_tokens is None:
+            source = "estimate"
+            prompt_tokens = estimate_prompt_tokens(self.model, self.contents)
+            if text is None and resp is not None and error is None:
+                try:
+                    text = resp.text
+                except Exception:
+                    text = ""
+            output_tokens = count_tokens(text or "")
+        record_call({
+            "at": datetime.now(tz=timezone.utc),
+            "page": TASK_PAGES.get(self.task, self.task),
+            "task": self.task,
+            "model": str(getattr(resp, "model_name", "") or _model_name(self.model)).removeprefix("models/"),
+            "provider": getattr(resp, "provider", "gemini"),
+            "prompt_tokens": int(prompt_tokens),
+            "output_tokens": int(output_tokens or 0),
+            "token_source": source,
+            "latency_ms": round(latency_ms, 1),
+            "ok": error is None,
+            "parsed": parsed,
+            "error": type(error).__name__ if error is not None else None,
+        })
+
+def start_call(task: str | None, model, contents) -> LlmCall | None:
+    """Begin timing a call for `task` (None: not instrumented, e.g. benchmarks)."""
+    return LlmCall(task, model, contents) if task else None
+
+def record_call(doc: dict) -> None:
+    """Queue one metrics document; instrumentation never fails the request."""
+    try:
+        from Connection import get_collection
+        from Write_queue import get_write_queue
+        get_write_queue().put(get_collection(METRICS_COLLECTION), doc)
+    except Exception:
+        pass
+
+# --- Report ---
+def llm_call_report(hours: float = 24, limit: int = REPORT_MAX_CALLS):
+    """
+    DataFrame of calls, latency percentiles and token use by (page, model)
+    over the last `hours` (newest `limit` calls at most).
+    """
+    import pandas as pd
+    from Connection import get_collection
+    since = datetime.now(tz=timezone.utc) - timedelta(hours=hours)
+    cur = (get_collection(METRICS_COLLECTION)
+           .find({"at": {"$gte": since}}, {"_id": 0, "page": 1, "model": 1, "latency_ms": 1, "ok": 1,
+                                           "parsed": 1, "prompt_tokens": 1, "output_tokens": 1})
+           .sort("at", -1)
+           .limit(limit))
+    df = pd.DataFrame(list(cur))
+    if df.empty:
+        return df
+    df["failed"] = ~df["ok"].astype(bool)
+    df["parse_failed"] = df["parsed"].eq(False)
+    g = df.groupby(["page", "model"])
+    out = pd.DataFrame({
+        "calls": g.size(),
+        "errors": g["failed"].sum().astype(int),
+        "parse_failures": g["parse_failed"].sum().astype(int),
+        "p50_ms": g["latency_ms"].quantile(0.50),
+        "p95_ms": g["latency_ms"].quantile(0.95),
+        "p99_ms": g["latency_ms"].quantile(0.99),
+        "avg_prompt_tokens": g["prompt_tokens"].mean(),
+        "avg_output_tokens": g["output_tokens"].mean(),
+        "total_tokens": g["prompt_tokens"].sum() + g["output_tokens"].sum(),
+    })
+    return out.round(1).reset_index().sort_values("total_tokens", ascending=False)
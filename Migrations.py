@@ -0,0 +1,159 @@
+# Migrations.py
+"""
+Versioned index/schema migrations for essay_assistant_db.
+
+`run_migrations(db)` is called once per process from Connection.get_mongo_client.
+Each migration runs once per database and is recorded in `schema_migrations`;
+add new ones to the end of MIGRATIONS with the next version number. Migrations
+are independent: one that fails (e.g. a unique index blocked by legacy
+duplicates) is reported and retried on the next start without holding back
+the others.
+
+    python Migrations.py --uri mongodb://localhost:27017 --check
+applies pending migrations and explains the hot queries, failing on any COLLSCAN.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+from Llm_metrics import METRICS_CAP_BYTES, METRICS_CAP_DOCS, METRICS_COLLECTION
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+DUPLICATE_EXAMPLES = 5     # duplicate values named when a unique index cannot be built
+
+# --- Migrations ---
+def duplicate_values(coll, field: str, limit: int = DUPLICATE_EXAMPLES) -> list:
+    """Up to `limit` values of `field` shared by more than one document."""
+    pipeline = [{"$group": {"_id": f"${field}", "n": {"$sum": 1}}}, {"$match": {"n": {"$gt": 1}}},
+                {"$limit": limit}]
+    return [d["_id"] for d in coll.aggregate(pipeline)]
+
+def _unique_index(coll, field: str, name: str) -> None:
+    try:
+        coll.create_index([(field, ASCENDING)], name=name, unique=True)
+    except (DuplicateKeyError, OperationFailure) as e:
+        if getattr(e, "code", None) != 11000:
+            raise
+        raise OperationFailure(f"duplicate {coll.name}.{field} values {duplicate_values(coll, field)} "
+                               f"block the unique index; resolve them and restart", code=11000) from e
+
+def _users_unique(db):
+    problems = []
+    for field, name in (("username", "username_unique"), ("email", "email_unique")):
+        try:
+            _unique_index(db["users"], field, name)  # one blocked index doesn't hold back the other
+        except OperationFailure as e:
+            problems.append(str(e))
+    if problems:
+        raise OperationFailure("; ".join(problems), code=11000)
+
+def _history_indexes(db):
+    db["user_performance"].create_index(
+        [("username", ASCENDING), ("timestamp", DESCENDING)], name="username_timestamp")
+    db["user_analysis"].create_index(
+        [("username", ASCENDING), ("_id", DESCENDING)], name="username_id")
+    db["self_test_attempts"].create_index(
+        [("username", ASCENDING), ("timestamp", DESCENDING)], name="username_timestamp")
+
+def _score_cache_indexes(db):
+    # default names: these indexes were first created lazily by Score_cache
+    db["score_cache"].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    db["score_cache"].create_index([("last_access", ASCENDING)])
+
+def _llm_metrics_capped(db):
+    try:
+        db.create_collection(METRICS_COLLECTION, capped=True, size=METRICS_CAP_BYTES, max=METRICS_CAP_DOCS)
+    except CollectionInvalid:
+        # already exists; auto-created uncapped by inserts if this migration was held back earlier
+        if not db[METRICS_COLLECTION].options().get("capped"):
+            db.command("convertToCapped", METRICS_COLLECTION, size=METRICS_CAP_BYTES)
+    db[METRICS_COLLECTION].create_index([("at", DESCENDING)], name="at_desc")
+
+MIGRATIONS = [
+    (1, "users: unique username/email", _users_unique),
+    (2, "history: (username, timestamp/_id) query indexes", _history_indexes),
+    (3, "score_cache: TTL + LRU indexes", _score_cache_indexes),
+    (4, "llm_metrics: capped per-call metrics", _llm_metrics_capped),
+]
+
+# --- Runner ---
+def applied_versions(db) -> set[int]:
+    return {d["_id"] for d in db[MIGRATIONS_COLLECTION].find({}, {"_id": 1})}
+
+def run_migrations(db) -> list[str]:
+    """
+    Apply pending migrations in order. Returns a list of problems (empty when
+    everything is applied); a failed migration is skipped, the rest still
+    run, and it is retried on the next process start.
+    """
+    problems = []
+    done = applied_versions(db)
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            fn(db)
+        except Exception as e:  # not only PyMongoError: e.g. mongomock has no capped collections
+            problems.append(f"migration {version} ({name}) failed: {e}")
+            continue
+        try:
+            db[MIGRATIONS_COLLECTION].insert_one(
+                {"_id": version, "name": name, "applied_at": datetime.now(tz=timezone.utc)})
+        except DuplicateKeyError:
+            pass  # another process recorded it first
+    return problems
+
+# --- Explain-plan check ---
+def hot_queries(db):
+    """(label, cursor) for the queries the pages run on every visit."""
+    u = "__explain_probe__"
+    return [
+        ("users by username", db["users"].find({"username": u})),
+        ("users by email", db["users"].find({"email": u})),
+        ("user_performance history", db["user_performance"].find({"username": u}).sort("timestamp", -1)),
+        ("user_performance suggestions",
+         db["user_performance"].find({"username": u, "suggestions": {"$exists": True}}).sort("timestamp", -1)),
+        ("user_analysis latest", db["user_analysis"].find({"username": u}).sort("_id", -1).limit(1)),
+        ("self_test_attempts history", db["self_test_attempts"].find({"username": u}).sort("timestamp", -1)),
+    ]
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []) or []:
+        yield from _stages(child)
+
+def collection_scans(db) -> list[str]:
+    """Labels of hot queries whose winning plan contains a COLLSCAN."""
+    bad = []
+    for label, cursor in hot_queries(db):
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_stages(plan)):
+            bad.append(label)
+    return bad
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--uri", default="mongodb://localhost:27017")
+    ap.add_argument("--db", default="essay_assistant_db")
+    ap.add_argument("--check", action="store_true", help="fail if a hot query uses a collection scan")
+    args = ap.parse_args(argv)
+
+    db = MongoClient(args.uri, serverSelectionTimeoutMS=5000)[args.db]
+    problems = run_migrations(db)
+    print(f"applied: {sorted(applied_versions(db))}")
+    if args.check:
+        problems += [f"COLLSCAN: {label}" for label in collection_scans(db)]
+    for p in problems:
+        print(f"FAIL {p}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# Mongo_profile.py
+"""
+MongoClient settings (pool sizing, wire compression, read preference).
+
+Connection.py applies DEFAULT_PROFILE with any `[mongo]` secrets on top, e.g.
+
+    [mongo]
+    max_pool_size = 100
+    min_pool_size = 10
+    compressors = ["zstd", "zlib"]
+    dashboard_read_preference = "secondaryPreferred"
+
+Compressors whose Python module is missing are dropped (zstd needs
+`zstandard`, snappy needs `python-snappy`; zlib is always available).
+"""
+from __future__ import annotations
+
+from importlib.util import find_spec
+
+from pymongo import ReadPreference
+
+DEFAULT_PROFILE = {
+    "max_pool_size": 50,              # connections per server, shared by all sessions
+    "min_pool_size": 0,               # warm connections kept open
+    "max_idle_time_ms": 5 * 60_000,   # close pooled connections idle this long
+    "wait_queue_timeout_ms": 10_000,  # fail fast instead of queueing forever when the pool is exhausted
+    "compressors": ["zstd", "snappy", "zlib"],
+    "zlib_level": 1,                  # cheapest zlib level; most of the win on JSON-ish documents
+    "server_selection_timeout_ms": 15_000,
+    "connect_timeout_ms": 15_000,
+    "socket_timeout_ms": 20_000,
+    "read_preference": "primary",
+    "dashboard_read_preference": "primaryPreferred",  # Performance page reads tolerate slight lag
+}
+
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+def available_compressors(names) -> list[str]:
+    """`names` in order, keeping only those this interpreter can use."""
+    if isinstance(names, str):
+        names = names.split(",")
+    out = []
+    for n in (x.strip().lower() for x in names or []):
+        module = _COMPRESSOR_MODULES.get(n)
+        if module and n not in out and find_spec(module) is not None:
+            out.append(n)
+    return out
+
+def read_preference(name: str):
+    """pymongo read preference for a name such as 'secondaryPreferred'."""
+    try:
+        return _READ_PREFERENCES[str(name).replace("_", "").lower()]
+    except KeyError:
+        raise ValueError(f"unknown read preference: {name!r}") from None
+
+def merge_profile(overrides: dict | None = None) -> dict:
+    profile = dict(DEFAULT_PROFILE)
+    profile.update({k: v for k, v in dict(overrides or {}).items() if k in DEFAULT_PROFILE and v not in (None, "")})
+    return profile
+
+def client_options(profile: dict) -> dict:
+    """MongoClient keyword arguments for a (merged) profile."""
+    opts = {
+        "maxPoolSize": int(profile["max_pool_size"]),
+        "minPoolSize": int(profile["min_pool_size"]),
+        "maxIdleTimeMS": int(profile["max_idle_time_ms"]),
+        "waitQueueTimeoutMS": int(profile["wait_queue_timeout_ms"]),
+        "serverSelectionTimeoutMS": int(profile["server_selection_timeout_ms"]),
+        "connectTimeoutMS": int(profile["connect_timeout_ms"]),
+        "socketTimeoutMS": int(profile["socket_timeout_ms"]),
+        "readPreference": read_preference(profile["read_preference"]).mongos_mode,
+    }
+    compressors = available_compressors(profile["compressors"])
+    if compressors:
+        opts["compressors"] = ",".join(compressors)
+        if "zlib" in compressors:
+            opts["zlibCompressionLevel"] = int(profile["zlib_level"])
+    return opts
+
+# Profiles compared by `python Benchmarks.py mongo-profiles`
+BENCH_PROFILES = {
+    "pymongo-defaults": None,  # MongoClient(uri) with nothing set
+    "default": {},
+    "small-pool": {"max_pool_size": 10},
+    "large-pool-warm": {"max_pool_size": 200, "min_pool_size": 20},
+    "no-compression": {"compressors": []},
+    "zlib": {"compressors": ["zlib"]},
+    "zstd": {"compressors": ["zstd"]},
+    "snappy": {"compressors": ["snappy"]},
+}
@@ -0,0 +1,134 @@
+# Rollups.py
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from Connection import get_collection
+from Scoring import LENSES
+
+ROLLUP_COLLECTION = "user_rollups"
+LAST_N = 20                         # recent totals kept for trend deltas
+APPLIED_IDS_MAX = 200               # latest attempt _ids kept so each is folded in once (> a write batch)
+FIELDS = LENSES + ["total_out_of_20"]
+
+def _type_key(label: str) -> str:
+    # Mongo field names may not contain '.' or start with '$'
+    return (label or "Unknown").replace(".", "_").lstrip("$") or "Unknown"
+
+def _rollup_update(scores: dict, essay_type: str, source: str, when: datetime, attempt_id) -> dict:
+    """One atomic $inc/$push/$set update for a single scored attempt."""
+    bt = f"by_type.{source}.{_type_key(essay_type)}"
+    inc = {"count": 1, f"by_source.{source}": 1, f"{bt}.count": 1}
+    for f in FIELDS:
+        v = scores.get(f)
+        if isinstance(v, (int, float)):
+            inc[f"sums.{f}"] = v
+            inc[f"counts.{f}"] = 1
+            inc[f"{bt}.sums.{f}"] = v
+            inc[f"{bt}.counts.{f}"] = 1
+    update = {"$inc": inc, "$set": {"updated_at": when},
+              "$push": {"applied_ids": {"$each": [attempt_id], "$slice": -APPLIED_IDS_MAX}}}
+    total = scores.get("total_out_of_20")
+    if isinstance(total, (int, float)):
+        update["$push"]["last_totals"] = {"$each": [{"t": when, "total": total, "type": essay_type}],
+                                          "$slice": -LAST_N}
+    return update
+
+def record_attempt(username: str, scores: dict, essay_type: str, source: str,
+                   when: datetime | None = None, *, attempt_id) -> None:
+    """
+    Fold one attempt into the user's rollup. Call after the attempt itself is
+    saved, with its _id (Write_queue's `on_written` argument). The update is
+    skipped when the rollup already holds that _id in `applied_ids`: a rebuild
+    from history (here, or get_rollup() on another page) that ran after the
+    insert has counted it already. A user without a rollup gets one rebuilt,
+    which includes this attempt. Failures are non-fatal.
+    """
+    when = when or datetime.now(tz=timezone.utc)
+    update = _rollup_update(scores or {}, essay_type, source, when, attempt_id)
+    coll = get_collection(ROLLUP_COLLECTION)
+    try:
+        res = coll.update_one({"_id": username, "applied_ids": {"$ne": attempt_id}}, update)
+        if res.matched_count == 0 and coll.count_documents({"_id": username}, limit=1) == 0:
+            rebuild_rollup(username)
+    except PyMongoError:
+        pass  # get_rollup() rebuilds from history if the document is missing
+
+def _attempt_from_doc(doc: dict):
+    """(scores, essay_type, source) for a saved user_performance document."""
+    if isinstance(doc.get("suggestions"), dict):
+        s = doc["suggestions"]
+        block = s.get("essay_evaluation") or s.get("essay_score") or {}
+        return block.get("scores", {}), block.get("type_of_essay", "Unknown"), "suggestion"
+    if isinstance(doc.get("self_test"), dict):
+        t = doc["self_test"]
+        intended = t.get("intended", {})
+        return t.get("scores", {}), f"{intended.get('part', '—')} / {intended.get('type', '—')}", "self_test"
+    return None
+
+def rebuild_rollup(username: str) -> dict | None:
+    """
+    Build the rollup from raw history (one-off for users saved before rollups
+    existed). The newest _ids go into `applied_ids`, so record_attempt calls
+    still pending for attempts counted here become no-ops.
+    """
+    doc = {"_id": username, "count": 0, "sums": {}, "counts": {}, "by_type": {}, "by_source": {},
+           "last_totals": [], "applied_ids": []}
+    cur = (get_collection("user_performance")
+           .find({"username": username},
+                 {"timestamp": 1, "suggestions.essay_evaluation": 1, "suggestions.essay_score": 1, "self_test": 1})
+           .sort("timestamp", 1))
+    ids = []
+    for raw in cur:
+        ids.append(raw["_id"])
+        parsed = _attempt_from_doc(raw)
+        if parsed is None:
+            continue
+        scores, essay_type, source = parsed
+        doc["count"] += 1
+        doc["by_source"][source] = doc["by_source"].get(source, 0) + 1
+        bt = (doc["by_type"].setdefault(source, {})
+              .setdefault(_type_key(essay_type), {"count": 0, "sums": {}, "counts": {}}))
+        bt["count"] += 1
+        for f in FIELDS:
+            v = (scores or {}).get(f)
+            if isinstance(v, (int, float)):
+                for target in (doc, bt):
+                    target["sums"][f] = target["sums"].get(f, 0) + v
+                    target["counts"][f] = target["counts"].get(f, 0) + 1
+        total = (scores or {}).get("total_out_of_20")
+        if isinstance(total, (int, float)):
+            doc["last_totals"] = (doc["last_totals"] + [{"t": raw.get("timestamp"), "total": total,
+                                                         "type": essay_type}])[-LAST_N:]
+    if not doc["count"]:
+        return None
+    # ObjectIds are assigned at insert, so the largest are the ones whose callbacks may be pending
+    doc["applied_ids"] = sorted(ids, key=str)[-APPLIED_IDS_MAX:]
+    doc["updated_at"] = datetime.now(tz=timezone.utc)
+    try:
+        get_collection(ROLLUP_COLLECTION).insert_one(doc)
+    except DuplicateKeyError:
+        # another request built it concurrently from the same history
+        return get_collection(ROLLUP_COLLECTION).find_one({"_id": username})
+    return doc
+
+def get_rollup(username: str) -> dict | None:
+    """The user's rollup document (built from history on first use)."""
+    doc = get_collection(ROLLUP_COLLECTION).find_one({"_id": username})
+    return doc if doc is not None else rebuild_rollup(username)
+
+def _means(block: dict) -> dict:
+    sums, counts = block.get("sums", {}), block.get("counts", {})
+    return {f: round(sums[f] / counts[f], 2) for f in FIELDS if counts.get(f)}
+
+def rollup_means(doc: dict) -> dict:
+    """{'overall': {lens: mean}, 'by_type': {source: {type: {'count': n, lens: mean}}}}."""
+    return {
+        "overall": _means(doc),
+        "by_type": {
+            source: {t: {"count": b.get("count", 0), **_means(b)} for t, b in types.items()}
+            for source, types in doc.get("by_type", {}).items()
+        },
+    }
@@ -0,0 +1,179 @@
+# Score_cache.py
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import streamlit as st
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from Connection import get_collection
+
+# --- Settings ---
+CACHE_COLLECTION = "score_cache"
+CACHE_TTL_SECONDS = 7 * 24 * 3600      # persistent tier: one week
+CACHE_MAX_DOCS = 5000                  # persistent tier: LRU-evicted above this
+MEMORY_MAX_ENTRIES = 256               # in-process tier
+EVICT_CHECK_EVERY = 50                 # puts between size checks
+
+# --- Keys ---
+def _hash_part(h, part) -> None:
+    """Feed one prompt part into the hash in a type-stable way."""
+    if part is None:
+        h.update(b"N:")
+    elif isinstance(part, bytes):
+        h.update(b"B:" + hashlib.sha256(part).digest())
+    elif isinstance(part, str):
+        h.update(b"S:" + hashlib.sha256(part.encode("utf-8")).digest())
+    elif isinstance(part, (dict, list, tuple)):
+        blob = json.dumps(part, sort_keys=True, default=str, ensure_ascii=False)
+        h.update(b"J:" + hashlib.sha256(blob.encode("utf-8")).digest())
+    elif hasattr(part, "tobytes") and hasattr(part, "size"):
+        # PIL.Image: pixels + geometry identify the upload
+        h.update(f"I:{part.mode}:{part.size}:".encode("utf-8"))
+        h.update(hashlib.sha256(part.tobytes()).digest())
+    else:
+        h.update(b"R:" + repr(part).encode("utf-8"))
+    h.update(b"|")
+
+def make_cache_key(model_name: str, system_prompt: str, parts, *, extra=None) -> str:
+    """
+    Content-addressed key over everything that can change the model's answer:
+    model name, system prompt, essay parts (text/image/bytes) and extra context
+    such as the intended Part/Type or the student profile.
+    """
+    h = hashlib.sha256()
+    _hash_part(h, model_name)
+    _hash_part(h, system_prompt)
+    for p in (parts if isinstance(parts, (list, tuple)) else [parts]):
+        _hash_part(h, p)
+    _hash_part(h, extra)
+    return h.hexdigest()
+
+# --- Cache ---
+class ScoreCache:
+    """Two-tier (in-process LRU + MongoDB) cache of normalized scoring results."""
+
+    def __init__(self, collection_name: str = CACHE_COLLECTION, *,
+                 ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_docs: int = CACHE_MAX_DOCS,
+                 memory_entries: int = MEMORY_MAX_ENTRIES):
+        self.collection_name = collection_name
+        self.ttl_seconds = ttl_seconds
+        self.max_docs = max_docs
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    # Mongo tier
+    def _collection(self):
+        # TTL/last_access indexes come from Migrations (version 3)
+        return get_collection(self.collection_name)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    # Memory tier
+    def _memory_get(self, key: str):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                self._memory.pop(key, None)
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: dict, expires: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # Public API
+    def get(self, key: str):
+        """Return a copy of the cached result for `key`, or None on a miss."""
+        value = self._memory_get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return copy.deepcopy(value)
+
+        try:
+            now = datetime.now(tz=timezone.utc)
+            doc = self._collection().find_one_and_update(
+                {"_id": key, "expires_at": {"$gt": now}},
+                {"$set": {"last_access": now}},
+                projection={"value": 1, "expires_at": 1},
+            )
+        except PyMongoError:
+            self._count("errors")
+            doc = None
+
+        if not doc:
+            self._count("misses")
+            return None
+
+        expires_at = doc["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        self._memory_put(key, doc["value"], expires_at.timestamp())
+        self._count("mongo_hits")
+        return copy.deepcopy(doc["value"])
+
+    def put(self, key: str, value: dict) -> None:
+        """Store a normalized result in both tiers (Mongo failures are non-fatal)."""
+        now = datetime.now(tz=timezone.utc)
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        value = copy.deepcopy(value)
+        self._memory_put(key, value, expires_at.timestamp())
+        self._count("stores")
+        try:
+            coll = self._collection()
+            coll.replace_one(
+                {"_id": key},
+                {"value": value, "created_at": now, "last_access": now, "expires_at": expires_at},
+                upsert=True,
+            )
+            with self._lock:
+                self._puts += 1
+                check = self._puts % EVICT_CHECK_EVERY == 0
+            if check:
+                self._evict(coll)
+        except PyMongoError:
+            self._count("errors")
+
+    def _evict(self, coll) -> None:
+        """Drop least-recently-used documents once the collection exceeds max_docs."""
+        excess = coll.estimated_document_count() - self.max_docs
+        if excess <= 0:
+            return
+        stale = coll.find({}, {"_id": 1}).sort("last_access", ASCENDING).limit(excess)
+        ids = [d["_id"] for d in stale]
+        if ids:
+            coll.delete_many({"_id": {"$in": ids}})
+
+    def stats(self) -> dict:
+        """Counters plus the fraction of lookups served without a model call."""
+        with self._lock:
+            out = dict(self.counters)
+            out["memory_entries"] = len(self._memory)
+        hits = out["memory_hits"] + out["mongo_hits"]
+        lookups = hits + out["misses"]
+        out["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return out
+
+@st.cache_resource(show_spinner=False)
+def get_score_cache() -> ScoreCache:
+    return ScoreCache()
@@ -0,0 +1,261 @@
+# Scoring.py
+from __future__ import annotations
+
+import json
+import re
+import threading
+
+from Health import model_metric, timed
+from Llm_metrics import start_call
+
+LENSES = ["content", "organization", "language", "communicative"]
+
+# Ask Gemini for JSON directly (no prose / code fences to strip)
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+MAX_FULL_RETRIES = 1      # full re-ask only when nothing parseable came back
+MAX_REPAIR_CUTS = 8       # how many trailing elements we may drop from truncated JSON
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+# --- Metrics ---
+_lock = threading.Lock()
+_counters = {"requests": 0, "parsed": 0, "repaired": 0, "parse_failures": 0,
+             "full_retries": 0, "score_retries": 0}
+
+def _count(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+def scoring_stats() -> dict:
+    """Process-wide parse/retry counters plus failure and retry rates."""
+    with _lock:
+        out = dict(_counters)
+    req = out["requests"] or 1
+    out["parse_failure_rate"] = round(out["parse_failures"] / req, 4)
+    out["retries_per_request"] = round((out["full_retries"] + out["score_retries"]) / req, 4)
+    return out
+
+# --- JSON parsing & repair ---
+def _scan(s: str):
+    """Return (open bracket stack, in_string, top-level-ish comma positions) for s."""
+    stack, commas = [], []
+    in_str = esc = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+        elif ch == ",":
+            commas.append(i)
+    return stack, in_str, commas
+
+def _close(s: str) -> str:
+    """Close any open string/brackets so a truncated document becomes parseable."""
+    stack, in_str, _ = _scan(s)
+    if in_str:
+        s += '"'
+    s = s.rstrip()
+    if s.endswith(","):
+        s = s[:-1]
+    elif s.endswith(":"):
+        s += " null"
+    s += "".join("}" if b == "{" else "]" for b in reversed(stack))
+    return _TRAILING_COMMA_RE.sub(r"\1", s)
+
+def _loads_dict(s: str):
+    try:
+        v = json.loads(s)
+    except Exception:
+        return None
+    return v if isinstance(v, dict) else None
+
+def parse_json(raw_text: str | None) -> tuple[dict | None, bool]:
+    """
+    Parse a model reply into a dict. Returns (data, repaired).
+    Handles code fences, prose around the object, trailing commas and
+    truncated output (unterminated strings / brackets, cut-off last element).
+    """
+    if not raw_text:
+        return None, False
+    s = _FENCE_RE.sub("", raw_text.strip())
+    start = s.find("{")
+    if start == -1:
+        return None, False
+    s = s[start:]
+
+    end = s.rfind("}") + 1
+    if end > 0:
+        data = _loads_dict(s[:end])
+        if data is not None:
+            return data, False
+        data = _loads_dict(_TRAILING_COMMA_RE.sub(r"\1", s[:end]))
+        if data is not None:
+            return data, True
+
+    # Truncated: close what is open, dropping incomplete trailing elements if needed
+    data = _loads_dict(_close(s))
+    if data is not None:
+        return data, True
+    _, _, commas = _scan(s)
+    for pos in reversed(commas[-MAX_REPAIR_CUTS:]):
+        data = _loads_dict(_close(s[:pos]))
+        if data is not None:
+            return data, True
+    return None, False
+
+# --- Score normalization ---
+def coerce_0_5(x):
+    try:
+        v = int(round(float(x)))
+        return max(0, min(5, v))
+    except Exception:
+        return None
+
+def fix_scores(scores: dict) -> dict:
+    """
+    Ensure scores are ints in [0,5] and compute total_out_of_20 if missing.
+    """
+    if not isinstance(scores, dict):
+        return {}
+    out = {}
+    for k in LENSES:
+        out[k] = coerce_0_5(scores.get(k))
+    if all(v is not None for v in out.values()):
+        try:
+            total = scores.get("total_out_of_20")
+            total = int(total) if total is not None else sum(out.values())
+        except Exception:
+            total = sum(out.values())
+        out["total_out_of_20"] = max(0, min(20, int(total)))
+    return out
+
+# --- Response schemas (Gemini's OpenAPI subset, passed as `response_schema`) ---
+STRING = {"type": "string"}
+STRINGS = {"type": "array", "items": STRING}
+
+def object_schema(properties: dict) -> dict:
+    """An object schema whose properties are all required."""
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+SCORES_SCHEMA = object_schema({k: {"type": "integer"} for k in LENSES + ["total_out_of_20"]})
+
+def json_config(response_schema: dict | None = None) -> dict:
+    """JSON_GENERATION_CONFIG, constrained to `response_schema` when given."""
+    return {**JSON_GENERATION_CONFIG, "response_schema": response_schema} if response_schema else JSON_GENERATION_CONFIG
+
+def scores_complete(scores: dict) -> bool:
+    return isinstance(scores, dict) and all(scores.get(k) is not None for k in LENSES)
+
+def _get_path(data: dict, path: tuple[str, ...]):
+    cur = data
+    for key in path:
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(key)
+    return cur
+
+def _set_path(data: dict, path: tuple[str, ...], value) -> None:
+    cur = data
+    for key in path[:-1]:
+        if not isinstance(cur.get(key), dict):
+            cur[key] = {}
+        cur = cur[key]
+    cur[path[-1]] = value
+
+def _retry_scores(extra: dict, scores_path: tuple[str, ...]) -> dict:
+    """
+    Scores from the scores-only follow-up. The system instruction still asks
+    for the full schema, so accept `scores_path`, {"scores": ...} or a bare dict.
+    """
+    for candidate in (_get_path(extra, scores_path), extra.get("scores"), extra):
+        scores = fix_scores(candidate or {})
+        if scores_complete(scores):
+            return scores
+    return {}
+
+SCORES_ONLY_PROMPT = (
+    "Your previous reply did not include valid scores. For the same essay, return JSON ONLY: "
+    '{"content": 0-5, "organization": 0-5, "language": 0-5, "communicative": 0-5, "total_out_of_20": 0-20}'
+)
+
+# --- Pipeline ---
+def _generate(model, contents, task, **opts):
+    """(response, call): `call` is finished by the caller once the reply is parsed."""
+    call = start_call(task, model, contents)
+    try:
+        with timed(model_metric(model)):
+            return model.generate_content(contents, **opts), call
+    except Exception as e:
+        if call:
+            call.finish(error=e)
+        raise
+
+def _parse_reply(resp, call):
+    try:
+        text = resp.text
+    except Exception as e:  # e.g. a blocked candidate has no text
+        if call:
+            call.finish(error=e)
+        raise
+    data, repaired = parse_json(text)
+    if call:
+        call.finish(resp, parsed=data is not None)
+    return data, repaired
+
+def score_json(model, parts: list, *, scores_path: tuple[str, ...], request_options: dict | None = None,
+               task: str | None = None, response_schema: dict | None = None):
+    """
+    Run one scoring request and return the parsed dict with scores at
+    `scores_path` normalized, or None if no usable JSON came back.
+
+    Malformed/truncated JSON is repaired locally first. The model is asked
+    again only for what is missing: a scores-only follow-up when the lens
+    scores are absent, and a full re-ask only when nothing parseable came back.
+    `response_schema` (the task's whole reply, scores at `scores_path` as
+    SCORES_SCHEMA) makes Gemini emit exactly that shape; the scores-only
+    follow-up is always held to SCORES_SCHEMA. Model/transport errors
+    propagate to the caller. With `task`, every model call is recorded by
+    Llm_metrics.
+    """
+    _count("requests")
+    opts = {"generation_config": json_config(response_schema)}
+    if request_options:
+        opts["request_options"] = request_options
+
+    data = None
+    for attempt in range(MAX_FULL_RETRIES + 1):
+        if attempt:
+            _count("full_retries")
+        data, repaired = _parse_reply(*_generate(model, parts, task, **opts))
+        if data is not None:
+            _count("repaired" if repaired else "parsed")
+            break
+    if data is None:
+        _count("parse_failures")
+        return None
+
+    scores = fix_scores(_get_path(data, scores_path) or {})
+    if not scores_complete(scores):
+        _count("score_retries")
+        try:
+            extra, _ = _parse_reply(*_generate(model, list(parts) + [SCORES_ONLY_PROMPT], task,
+                                               **{**opts, "generation_config": json_config(SCORES_SCHEMA)}))
+        except Exception:
+            extra = None
+        if extra:
+            scores = _retry_scores(extra, scores_path) or scores
+    _set_path(data, scores_path, scores)
+    return data
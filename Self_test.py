@@ -0,0 +1,142 @@
+# Self_test.py
+"""
+Self-Test attempts: the record saved to `self_test_attempts` (read by the
+Performance page) and an incrementally maintained progress dashboard.
+
+`SelfTestDashboard` keeps only the latest attempts plus running per-type
+sums, so adding an attempt and redrawing the dashboard cost the same at
+attempt 5 as at attempt 500.
+"""
+from __future__ import annotations
+
+from collections import deque
+
+from Scoring import LENSES
+
+ATTEMPTS_COLLECTION = "self_test_attempts"
+RECENT_MAX = 50        # attempts kept for the trend chart
+SHOWN_MAX = 10         # attempts listed as expanders, newest first
+FIELDS = LENSES + ["total_out_of_20"]
+DETAIL_FIELDS = {"feedback": {}, "next_focus": [], "recommended_part3_choices": []}   # field -> default
+COLUMNS = {"content": "Content", "organization": "Organization", "language": "Language",
+           "communicative": "Communicative", "total_out_of_20": "Total"}
+
+# --- Records ---
+RECORD_FIELDS = ["date", "part", "type_of_essay", "intended", "detected", "scores", *DETAIL_FIELDS]
+
+def type_label(intended: dict) -> str:
+    return f"{intended.get('part', '—')} / {intended.get('type', '—')}"
+
+def attempt_record(data: dict, date: str) -> dict:
+    """
+    The attempt as kept in session and saved under `attempt` in
+    self_test_attempts: only what the Self-Test and Performance pages show
+    (the full reply is already saved in user_performance).
+    """
+    intended = data.get("intended", {})
+    return {
+        "date": date,
+        "part": intended.get("part", "—"),
+        "type_of_essay": intended.get("type", "—"),
+        "intended": intended,
+        "detected": data.get("detected", {}),
+        "scores": data.get("scores", {}),
+        **{f: data.get(f, default) for f, default in DETAIL_FIELDS.items()},
+    }
+
+def _slim(attempt: dict) -> dict:
+    """Older records kept the details inside the full `analysis` reply."""
+    old = attempt.pop("analysis", None) or {}
+    for f, default in DETAIL_FIELDS.items():
+        attempt.setdefault(f, old.get(f, default))
+    return attempt
+
+def load_attempts(username: str, limit: int = RECENT_MAX) -> tuple[int, list[dict], dict]:
+    """
+    (total saved, newest `limit` attempts oldest first, per-type aggregates
+    over all of them) for `username`; run once per session.
+    """
+    from Connection import get_collection
+    coll = get_collection(ATTEMPTS_COLLECTION)
+    projection = {"_id": 0, **{f"attempt.{f}": 1 for f in RECORD_FIELDS},
+                  **{f"attempt.analysis.{f}": 1 for f in DETAIL_FIELDS}}
+    cur = coll.find({"username": username}, projection).sort("timestamp", -1).limit(limit)
+    recent = [_slim(d["attempt"]) for d in cur][::-1]
+    group = {"_id": {"part": "$attempt.part", "type": "$attempt.type_of_essay"}, "count": {"$sum": 1}}
+    for f in FIELDS:
+        # $sum ignores missing/non-numeric scores; count the same ones _fold counts
+        group[f"s_{f}"] = {"$sum": f"$attempt.scores.{f}"}
+        group[f"c_{f}"] = {"$sum": {"$cond": [{"$isNumber": f"$attempt.scores.{f}"}, 1, 0]}}
+    by_type, total = {}, 0
+    for g in coll.aggregate([{"$match": {"username": username}}, {"$group": group}]):
+        label = f"{g['_id'].get('part', '—')} / {g['_id'].get('type', '—')}"
+        by_type[label] = {"count": g["count"],
+                          "sums": {f: g[f"s_{f}"] for f in FIELDS if g[f"c_{f}"]},
+                          "counts": {f: g[f"c_{f}"] for f in FIELDS if g[f"c_{f}"]}}
+        total += g["count"]
+    return total, recent, by_type
+
+# --- Dashboard ---
+class SelfTestDashboard:
+    """Latest attempts plus running aggregates; the trend figure is rebuilt only when an attempt is added."""
+
+    def __init__(self, recent_max: int = RECENT_MAX):
+        self.count = 0
+        self.recent: deque[tuple[int, dict]] = deque(maxlen=recent_max)  # (attempt number, attempt)
+        self.by_type: dict[str, dict] = {}   # label -> {"count", "sums", "counts"}, same shape as a rollup's by_type
+        self.version = 0
+        self._figure = (-1, None)
+
+    def _fold(self, attempt: dict) -> None:
+        bt = self.by_type.setdefault(type_label(attempt.get("intended", {})), {"count": 0, "sums": {}, "counts": {}})
+        bt["count"] += 1
+        for f in FIELDS:
+            v = attempt.get("scores", {}).get(f)
+            if isinstance(v, (int, float)):
+                bt["sums"][f] = bt["sums"].get(f, 0) + v
+                bt["counts"][f] = bt["counts"].get(f, 0) + 1
+
+    def add(self, attempt: dict) -> None:
+        self.count += 1
+        self.recent.append((self.count, attempt))
+        self._fold(attempt)
+        self.version += 1
+
+    @classmethod
+    def from_history(cls, total: int, attempts: list[dict], by_type: dict | None = None) -> "SelfTestDashboard":
+        """
+        Seed from saved attempts (oldest first, possibly only the latest of
+        `total`). `by_type` (from load_attempts) covers all of them; without
+        it the averages cover the loaded attempts only.
+        """
+        dash = cls()
+        dash.count = max(total, len(attempts)) - len(attempts)
+        for a in attempts:
+            dash.add(a)
+        if by_type:
+            dash.by_type = {t: {"count": b.get("count", 0), "sums": dict(b.get("sums", {})),
+                                "counts": dict(b.get("counts", {}))} for t, b in by_type.items()}
+        return dash
+
+    def shown(self) -> list[tuple[int, dict]]:
+        """Newest SHOWN_MAX attempts, newest first."""
+        n = min(SHOWN_MAX, len(self.recent))
+        return [self.recent[-i] for i in range(1, n + 1)]
+
+    def averages(self) -> list[dict]:
+        rows = []
+        for t, b in self.by_type.items():
+            sums, counts = b.get("sums", {}), b.get("counts", {})
+            rows.append({"Type": t, "Attempts": b.get("count", 0),
+                         **{COLUMNS[f]: round(sums[f] / counts[f], 2) if counts.get(f) else None for f in FIELDS}})
+        return rows
+
+    def trend_figure(self):
+        version, fig = self._figure
+        if version != self.version:
+            import plotly.express as px
+            rows = [{"Attempt": n, **{COLUMNS[f]: a.get("scores", {}).get(f) for f in FIELDS}}
+                    for n, a in self.recent]
+            fig = px.line(rows, x="Attempt", y=list(COLUMNS.values()), markers=True)
+            self._figure = (self.version, fig)
+        return fig
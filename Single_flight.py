@@ -0,0 +1,115 @@
+# Single_flight.py
+"""
+Process-wide single-flight for model calls.
+
+Concurrent callers with the same key (the pages use their score-cache key,
+which already covers model, prompt and essay) share one in-flight call:
+the first runs it, the rest wait and get a copy of its result or its error.
+Nothing is remembered once the call finishes; that is Score_cache's job.
+"""
+from __future__ import annotations
+
+import copy
+import threading
+from typing import Callable, Iterable, Iterator
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self.counters = {"leaders": 0, "coalesced": 0, "errors": 0, "wait_timeouts": 0}
+
+    def _join(self, key: str) -> tuple[_Call, bool]:
+        """(call, is_leader) for `key`, registering a new call if none is in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.counters["coalesced"] += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.counters["leaders"] += 1
+            return call, True
+
+    def _finish(self, key: str, call: _Call, result=None, error: BaseException | None = None) -> None:
+        call.result, call.error = result, error
+        with self._lock:
+            self._calls.pop(key, None)
+            if error is not None:
+                self.counters["errors"] += 1
+        call.done.set()
+
+    def _follow(self, call: _Call, timeout: float | None):
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.counters["wait_timeouts"] += 1
+            return False, None
+        if call.error is not None:
+            raise call.error
+        return True, copy.deepcopy(call.result)
+
+    def do(self, key: str, fn: Callable[[], object], *, timeout: float | None = None):
+        """
+        Run `fn()` unless an identical call is already in flight, in which case
+        wait (up to `timeout`, then run it ourselves) and return a copy of its result.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            ok, result = self._follow(call, timeout)
+            return result if ok else fn()
+        try:
+            result = fn()
+        except BaseException as e:  # a Streamlit stop/rerun must not propagate to other sessions
+            self._finish(key, call, error=e if isinstance(e, Exception) else RuntimeError("call abandoned"))
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    def stream(self, key: str, make_iter: Callable[[], Iterable[str]], *,
+               timeout: float | None = None) -> Iterator[str]:
+        """
+        Streaming variant for text: the leader yields chunks as they arrive;
+        followers wait and yield the leader's full text as one chunk.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            ok, text = self._follow(call, timeout)
+            if ok:
+                yield text
+            else:
+                yield from make_iter()
+            return
+        chunks = []
+        try:
+            for chunk in make_iter():
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as e:  # includes GeneratorExit when the reader stops early
+            self._finish(key, call, error=e if isinstance(e, Exception) else RuntimeError("call abandoned"))
+            raise
+        self._finish(key, call, result="".join(chunks))
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self.counters)
+            out["in_flight"] = len(self._calls)
+        calls = out["leaders"] + out["coalesced"]
+        out["coalesced_rate"] = round(out["coalesced"] / calls, 4) if calls else 0.0
+        return out
+
+_flight = SingleFlight()
+
+def single_flight(key: str, fn: Callable[[], object], *, timeout: float | None = None):
+    return _flight.do(key, fn, timeout=timeout)
+
+def single_flight_stream(key: str, make_iter: Callable[[], Iterable[str]], *, timeout: float | None = None):
+    return _flight.stream(key, make_iter, timeout=timeout)
+
+def single_flight_stats() -> dict:
+    """Leaders (real model calls), coalesced callers and errors since process start."""
+    return _flight.stats()
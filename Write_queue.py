@@ -0,0 +1,178 @@
+# Write_queue.py
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+import streamlit as st
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, PyMongoError
+
+from Data_version import bump_docs
+
+log = logging.getLogger(__name__)
+
+MAX_BATCH = 100            # docs per insert_many
+FLUSH_INTERVAL_S = 0.5     # max time a write waits for batch-mates
+MAX_RETRIES = 3            # transient failures only
+RETRY_BACKOFF_S = 0.5      # doubled per retry
+SHUTDOWN_TIMEOUT_S = 10.0
+
+_TRANSIENT = (AutoReconnect, ConnectionFailure)  # includes NetworkTimeout / ServerSelectionTimeoutError
+_DUPLICATE_KEY = 11000
+
+class _Marker:
+    """Queue sentinel: stop the worker or signal a flush barrier."""
+    def __init__(self, stop: bool = False):
+        self.stop = stop
+        self.done = threading.Event()
+
+class WriteBehindQueue:
+    """
+    Background inserts so the Streamlit script thread doesn't pay a MongoDB
+    round trip after each model call. Writes are batched per collection with
+    insert_many, retried on transient errors and flushed at process exit.
+    `on_written(doc_id)` callbacks run on the worker after their document
+    is stored and get its _id; then the owners' Data_version counters are
+    bumped.
+    """
+
+    def __init__(self, *, max_batch: int = MAX_BATCH, flush_interval_s: float = FLUSH_INTERVAL_S):
+        self.max_batch = max_batch
+        self.flush_interval_s = flush_interval_s
+        self._q: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._metrics = {"enqueued": 0, "written": 0, "batches": 0, "retries": 0, "failed": 0,
+                         "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    # Producer side
+    def put(self, collection, doc: dict, on_written: Callable[[object], None] | None = None) -> None:
+        """Queue `doc` for insertion into `collection` (a pymongo Collection)."""
+        if self._closed:
+            collection.insert_one(doc)  # shutting down: write through
+            if on_written:
+                on_written(doc["_id"])
+            bump_docs(collection.name, [doc])
+            return
+        with self._lock:
+            self._metrics["enqueued"] += 1
+        self._q.put((collection, doc, on_written))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until everything queued so far is written (or `timeout` passes)."""
+        marker = _Marker()
+        self._q.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = SHUTDOWN_TIMEOUT_S) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        marker = _Marker(stop=True)
+        self._q.put(marker)
+        marker.done.wait(timeout)
+
+    # Worker side
+    def _run(self) -> None:
+        while True:
+            item = self._q.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + self.flush_interval_s
+            while True:
+                if isinstance(item, _Marker):
+                    markers.append(item)
+                    break  # write what we have, then honour the barrier/stop
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._flush(batch)
+            for m in markers:
+                m.done.set()
+                if m.stop:
+                    return
+
+    def _flush(self, batch: list) -> None:
+        started = time.perf_counter()
+        groups: dict[str, tuple] = {}
+        for coll, doc, cb in batch:
+            groups.setdefault(coll.full_name, (coll, [], []))
+            groups[coll.full_name][1].append(doc)
+            groups[coll.full_name][2].append(cb)
+
+        for coll, docs, callbacks in groups.values():
+            written = self._insert_with_retry(coll, docs)
+            if not written:
+                continue
+            for i in written:
+                if callbacks[i] is None:
+                    continue
+                try:
+                    callbacks[i](docs[i]["_id"])
+                except Exception:
+                    log.exception("write-behind callback failed")
+            # after the callbacks, so a cache refilled on this version already sees their updates
+            bump_docs(coll.name, [docs[i] for i in written])
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            m = self._metrics
+            m["batches"] += 1
+            m["last_flush_ms"] = round(elapsed_ms, 1)
+            m["max_flush_ms"] = round(max(m["max_flush_ms"], elapsed_ms), 1)
+            m["total_flush_ms"] += elapsed_ms
+
+    def _insert_with_retry(self, coll, docs: list) -> list[int]:
+        """Indexes of `docs` that are stored (empty if the whole batch failed)."""
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                coll.insert_many(docs, ordered=False)
+                self._count("written", len(docs))
+                return list(range(len(docs)))
+            except BulkWriteError as e:
+                # a retried batch may already be partly stored: duplicate _ids mean "written"
+                errors = e.details.get("writeErrors", [])
+                failed = {err["index"] for err in errors if err.get("code") != _DUPLICATE_KEY}
+                self._count("written", len(docs) - len(failed))
+                if failed:
+                    self._count("failed", len(failed))
+                    log.error("write-behind: %d docs rejected by %s", len(failed), coll.full_name)
+                return [i for i in range(len(docs)) if i not in failed]
+            except _TRANSIENT:
+                if attempt == MAX_RETRIES:
+                    break
+                self._count("retries")
+                time.sleep(RETRY_BACKOFF_S * (2 ** attempt))
+            except PyMongoError:
+                log.exception("write-behind: insert into %s failed", coll.full_name)
+                break
+        self._count("failed", len(docs))
+        return []
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._metrics[name] += n
+
+    def stats(self) -> dict:
+        """Queue depth plus write/flush metrics."""
+        with self._lock:
+            out = dict(self._metrics)
+        total = out.pop("total_flush_ms")
+        out["avg_flush_ms"] = round(total / out["batches"], 1) if out["batches"] else 0.0
+        out["depth"] = self._q.qsize()
+        return out
+
+@st.cache_resource(show_spinner=False)
+def get_write_queue() -> WriteBehindQueue:
+    return WriteBehindQueue()
@@ -1,14 +1,18 @@
 # pages/1_User_Analysis.py
-import os, sys, json, datetime
+import os, sys, datetime
 import streamlit as st
-import google.generativeai as genai
 
 st.set_page_config(page_title="User Analysis", page_icon="🔍", layout="wide")
 
 # local imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from Connection import get_collection, get_genai_connection
-from File_handling import read_file_content
+from Connection import get_collection, request_options
+from File_handling import read_file_content, to_model_part
+from Score_cache import get_score_cache, make_cache_key
+from Llm_client import cache_model_name, get_scoring_model
+from Scoring import SCORES_SCHEMA, STRING, STRINGS, object_schema, score_json, scores_complete
+from Single_flight import single_flight
+from Write_queue import get_write_queue
 from Data_Visualization import display_user_analysis
 
 st.title("🔍 User Analysis (SPM Paper 2)")
@@ -17,7 +21,7 @@ st.write("Upload your essay to get **SPM-style feedback**: strengths, weaknesses
 # ---------------------------
 #  Model & Prompt
 # ---------------------------
-get_genai_connection()
+TASK = "user_analysis"
 
 SYSTEM_PROMPT = (
     "You are an experienced **SPM English Paper 2** examiner and teacher for secondary school students.\n"
@@ -82,53 +86,27 @@ SYSTEM_PROMPT = (
     "- If unsure of a lens, choose the nearest integer level.\n"
 )
 
-model = genai.GenerativeModel(
-    "gemini-2.5-flash",
-    system_instruction=SYSTEM_PROMPT
-)
+RESPONSE_SCHEMA = object_schema({
+    "strengths": STRINGS,
+    "weaknesses": STRINGS,
+    "writing_style": STRING,
+    "game_like_role": STRING,
+    "indicative_scores": SCORES_SCHEMA,
+    "top_priorities": STRINGS,
+})
+
+model = get_scoring_model(TASK, SYSTEM_PROMPT)
+MODEL_NAME = cache_model_name(model)
+score_cache = get_score_cache()
 
 # ---------------------------
 #  Helpers
 # ---------------------------
-def _safe_parse_json(raw_text: str):
-    start, end = raw_text.find("{"), raw_text.rfind("}") + 1
-    if start == -1 or end <= 0:
-        return None
-    try:
-        return json.loads(raw_text[start:end])
-    except Exception:
-        return None
-
-def _coerce_0_5(x):
-    try:
-        v = int(round(float(x)))
-        return max(0, min(5, v))
-    except Exception:
-        return None
-
-def _coerce_scores(d: dict) -> dict:
-    """
-    Ensure scores are ints in [0,5] and compute total_out_of_20 if missing.
-    """
-    if not isinstance(d, dict):
-        return {}
-    out = {}
-    for k in ["content", "organization", "language", "communicative"]:
-        out[k] = _coerce_0_5(d.get(k))
-    # compute total if we have all 4
-    if all(v is not None for v in out.values()):
-        try:
-            total = d.get("total_out_of_20")
-            total = int(total) if total is not None else sum(out.values())
-        except Exception:
-            total = sum(out.values())
-        out["total_out_of_20"] = max(0, min(20, int(total)))
-    return out
-
 def update_user_info(response_json):
     st.session_state["user_analysis"] = response_json
     if "user" in st.session_state:
-        get_collection("user_analysis").insert_one({
+        # written in the background; the page doesn't wait on MongoDB
+        get_write_queue().put(get_collection("user_analysis"), {
             "username": st.session_state["user"]["username"],
             "user_info": response_json,
             "date": datetime.datetime.now(tz=datetime.timezone.utc),
@@ -152,30 +130,36 @@ if uploaded_files and st.button("🔎 Analyze My Writing"):
         else:
             files.append(content)
 
-    with st.spinner("Analyzing..."):
-        try:
-            raw = model.generate_content(files).text
-        except Exception as e:
-            st.error(f"Model error: {e}")
-            st.stop()
-
-        data = _safe_parse_json(raw)
-        if not data:
-            st.error("⚠️ Could not parse response. Please try again.")
-            st.stop()
-
-        # Ensure required keys exist
-        data.setdefault("strengths", [])
-        data.setdefault("weaknesses", [])
-        data.setdefault("writing_style", "Mixed")
-        data.setdefault("game_like_role", "The Builder")
-        data.setdefault("indicative_scores", {})
-        data.setdefault("top_priorities", [])
-
-        # Coerce scores and compute total
-        data["indicative_scores"] = _coerce_scores(data.get("indicative_scores", {}))
-
-        update_user_info(data)
+    cache_key = make_cache_key(MODEL_NAME, SYSTEM_PROMPT, files)
+    data = score_cache.get(cache_key)
+
+    if data is None:
+        with st.spinner("Analyzing..."):
+            try:
+                # identical uploads in flight from other sessions share this call
+                data = single_flight(cache_key, lambda: score_json(
+                    model, [to_model_part(f) for f in files], scores_path=("indicative_scores",),
+                    request_options=request_options(TASK), task=TASK, response_schema=RESPONSE_SCHEMA), timeout=request_options(TASK)["timeout"])
+            except Exception as e:
+                st.error(f"Model error: {e}")
+                st.stop()
+
+            if not data:
+                st.error("⚠️ Could not parse response. Please try again.")
+                st.stop()
+
+            # Ensure required keys exist
+            data.setdefault("strengths", [])
+            data.setdefault("weaknesses", [])
+            data.setdefault("writing_style", "Mixed")
+            data.setdefault("game_like_role", "The Builder")
+            data.setdefault("indicative_scores", {})
+            data.setdefault("top_priorities", [])
+            # a result still missing lenses after the retry is shown but not cached
+            if scores_complete(data["indicative_scores"]):
+                score_cache.put(cache_key, data)
+
+    update_user_info(data)
 
 if "user_analysis" in st.session_state:
     st.success("✅ Analysis complete! Here’s your feedback:")
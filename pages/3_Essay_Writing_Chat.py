@@ -1,9 +1,8 @@
 # pages/3_Essay_Writing_Chat.py
 
-import os, sys
+import os, sys, time
 import streamlit as st
 from datetime import datetime
-import google.generativeai as genai
 
 # Streamlit Page Settings
 st.set_page_config(page_title="Essay Writing Chat", page_icon="💬")
@@ -12,12 +11,14 @@ st.write("Your personal essay coach! Ask me anything about SPM essay writing ✍
 
 # Local imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from Connection import get_genai_connection
+from Connection import get_model, model_config, request_options
+from Chat_context import DEFAULT_BUDGET_TOKENS, ChatContext, summary_prompt
+from Health import model_metric, timed
+from Llm_metrics import start_call
+from Score_cache import make_cache_key
+from Single_flight import single_flight, single_flight_stream
 from Authentication import verify_jwt_token  # Optional: Only if you use JWT login
 
-# Initialize Gemini API
-genai = get_genai_connection()
-
 # --- Session State Init ---
 if "messages" not in st.session_state:
     system_prompt = (
@@ -35,6 +36,12 @@ if "messages" not in st.session_state:
         {"role": "system", "content": system_prompt},
         {"role": "assistant", "content": "👋 Hello! I’m your essay coach. How can I help?"}
     ]
+if "chat_metrics" not in st.session_state:
+    st.session_state.chat_metrics = []  # one entry per assistant turn
+
+with st.sidebar:
+    stream_replies = st.toggle("⚡ Stream replies", value=True,
+                               help="Show the answer as it is written instead of waiting for the full reply.")
 '''
 # Load previous chats if logged in
 chats_collection = get_collection("chats")
@@ -45,36 +52,117 @@ if "jwt_token" in st.session_state:
         past_chat = chats_collection.find_one({"user_id": user_id})
         if past_chat:
             st.session_state.messages = past_chat["messages"]
+'''
+# Gemini model for this session's system prompt (cached across reruns)
+model = get_model("chat", st.session_state.messages[0]["content"])
+summarizer = get_model("chat_summary")
+summary_options = request_options("chat_summary")
 
-# Display existing messages
-for m in st.session_state.messages[1:]:
+def _model_chunks(contents):
+    call, parts, usage = start_call("chat", model, contents), [], None
+    try:
+        with timed(model_metric(model)):
+            for chunk in model.generate_content(contents, stream=True, request_options=request_options("chat")):
+                usage = getattr(chunk, "usage_metadata", None) or usage  # totals arrive on the last chunk
+                try:
+                    text = chunk.text
+                except ValueError:  # chunk without text parts (e.g. safety metadata only)
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+    except Exception as e:
+        call.finish(text="".join(parts), usage=usage, error=e)
+        raise
+    call.finish(text="".join(parts), usage=usage)
+
+def _generate_text(task: str, m, contents, options: dict) -> str:
+    call = start_call(task, m, contents)
+    try:
+        with timed(model_metric(m)):
+            resp = m.generate_content(contents, request_options=options)
+        text = resp.text
+    except Exception as e:
+        call.finish(error=e)
+        raise
+    call.finish(resp)
+    return text
+
+def _stream_reply(contents, turn: dict, key: str):
+    """Yield reply text chunk by chunk, recording time-to-first-token in `turn`."""
+    started = time.perf_counter()
+    # an identical request already streaming (e.g. a double submit) is shared, not repeated
+    for text in single_flight_stream(key, lambda: _model_chunks(contents), timeout=request_options("chat")["timeout"]):
+        if "ttft_s" not in turn:
+            turn["ttft_s"] = time.perf_counter() - started
+        turn["text"] += text
+        yield text
+    turn["total_s"] = time.perf_counter() - started
+
+# recent turns sent verbatim; older ones are summarized
+CONTEXT_BUDGET_TOKENS = int(model_config("chat").get("context_budget_tokens", DEFAULT_BUDGET_TOKENS))
+
+def _summarize(previous_summary: str, turns: list) -> str:
+    # runs on a background thread: no Streamlit calls here
+    prompt = summary_prompt(previous_summary, turns)
+    return single_flight(make_cache_key(summarizer.model_name, "chat_summary", prompt),
+                         lambda: _generate_text("chat_summary", summarizer, prompt, summary_options),
+                         timeout=summary_options["timeout"])
+
+if "chat_context" not in st.session_state:
+    st.session_state.chat_context = ChatContext(_summarize, budget_tokens=CONTEXT_BUDGET_TOKENS)
+
+QUICK_HELP = {
+    "📖 Sample Essay": "Write a short sample opening for a Part 2 guided essay on healthy lifestyle.",
+    "📝 Improve My Introduction": "How can I write a stronger thesis/intro for a guided essay?",
+    "🎯 Conclusion Tips": "Give 3 tips for writing a good conclusion for Part 3 Article.",
+}
+TAIL_MAX_MESSAGES = 20  # appended inside the fragment before one full rerun folds them into the transcript
+
+def _render_message(m: dict) -> None:
     with st.chat_message("user" if m["role"] == "user" else "assistant",
                          avatar="🧑‍🎓" if m["role"] == "user" else "📝"):
         st.markdown(m["content"])
-'''
-# Set up the Gemini model using the system prompt
-model = genai.GenerativeModel(
-    "gemini-2.5-flash",
-    system_instruction=st.session_state.messages[0]["content"]
-)
-
-# --- Chat Input ---
-if prompt := st.chat_input("Type your essay question here..."):
+
+def _answer(prompt: str) -> None:
+    """Show `prompt`, get the reply and append both to the conversation."""
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user", avatar="🧑‍🎓"):
         st.markdown(prompt)
 
+    # system prompt goes in via system_instruction; only budgeted turns are sent
+    contents = st.session_state.chat_context.build(st.session_state.messages[1:])
+    reply_key = make_cache_key(model.model_name, st.session_state.messages[0]["content"], contents)
+    turn = {"streamed": stream_replies, "text": ""}
     with st.chat_message("assistant", avatar="📝"):
-        with st.spinner("Thinking..."):
-            try:
-                response = model.generate_content(
-                    [{"role": m["role"], "parts": [m["content"]]} for m in st.session_state.messages]
-                )
-                reply = response.text
-            except Exception as e:
-                reply = f"⚠️ Error: {e}"
+        try:
+            if stream_replies:
+                reply = st.write_stream(_stream_reply(contents, turn, reply_key))
+            else:
+                with st.spinner("Thinking..."):
+                    started = time.perf_counter()
+                    reply = single_flight(
+                        reply_key,
+                        lambda: _generate_text("chat", model, contents, request_options("chat")),
+                        timeout=request_options("chat")["timeout"])
+                    turn["ttft_s"] = turn["total_s"] = time.perf_counter() - started
+                st.markdown(reply)
+        except Exception as e:
+            # keep whatever already streamed so the user doesn't lose it
+            reply = (turn["text"] + "\n\n" if turn["text"] else "") + f"⚠️ Error: {e}"
             st.markdown(reply)
+        if "ttft_s" in turn:
+            st.caption(f"⏱️ First token {turn['ttft_s']:.2f}s · full reply {turn.get('total_s', 0):.2f}s")
+
+    st.session_state.chat_metrics.append({
+        "at": datetime.now(),
+        "streamed": turn["streamed"],
+        "ttft_s": turn.get("ttft_s"),
+        "total_s": turn.get("total_s"),
+        "chars": len(reply),
+    })
 
+    # store the reply only once it is complete
     st.session_state.messages.append({"role": "assistant", "content": reply})
 
     # Save chat
@@ -85,25 +173,39 @@ if prompt := st.chat_input("Type your essay question here..."):
         #    upsert=True
         #)
 
-# --- Quick Help Buttons ---
-st.markdown("---")
-st.write("🎯 Quick Help:")
-c1, c2, c3 = st.columns(3)
-with c1:
-    if st.button("📖 Sample Essay"):
-        st.session_state.messages.append(
-            {"role": "user", "content": "Write a short sample opening for a Part 2 guided essay on healthy lifestyle."}
-        )
-        st.rerun()
-with c2:
-    if st.button("📝 Improve My Introduction"):
-        st.session_state.messages.append(
-            {"role": "user", "content": "How can I write a stronger thesis/intro for a guided essay?"}
-        )
-        st.rerun()
-with c3:
-    if st.button("🎯 Conclusion Tips"):
-        st.session_state.messages.append(
-            {"role": "user", "content": "Give 3 tips for writing a good conclusion for Part 3 Article."}
-        )
-        st.rerun()
+# --- Transcript ---
+# A full run draws the conversation once; new turns are appended by the fragment below
+st.session_state.chat_rendered = len(st.session_state.messages)
+for m in st.session_state.messages[1:]:
+    _render_message(m)
+
+# --- Chat Input & Quick Help ---
+def _queue_prompt() -> None:
+    st.session_state.pending_prompt = st.session_state.chat_prompt
+
+# outside the fragment so it stays pinned to the bottom of the page; a typed
+# turn therefore reruns the whole page and is answered by the fragment below
+st.chat_input("Type your essay question here...", key="chat_prompt", on_submit=_queue_prompt)
+
+@st.fragment
+def chat_panel():
+    # a Quick Help turn reruns only this fragment: setup, model and transcript above are not redone
+    tail = st.container()
+    prompt = st.session_state.pop("pending_prompt", None)
+    st.markdown("---")
+    st.write("🎯 Quick Help:")
+    for col, (label, question) in zip(st.columns(len(QUICK_HELP)), QUICK_HELP.items()):
+        with col:
+            if st.button(label):
+                prompt = question
+
+    with tail:
+        for m in st.session_state.messages[st.session_state.chat_rendered:]:
+            _render_message(m)
+        if prompt:
+            _answer(prompt)
+
+    if len(st.session_state.messages) - st.session_state.chat_rendered > TAIL_MAX_MESSAGES:
+        st.rerun()  # fold the appended turns into the transcript so the fragment stays small
+
+chat_panel()
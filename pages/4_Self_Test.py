@@ -2,16 +2,23 @@
 import os, sys, json
 from datetime import datetime
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import google.generativeai as genai
 
 st.set_page_config(page_title="Self-Test 📚", page_icon="📚", layout="wide")
 
 # --- Local imports ---
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from Connection import get_genai_connection, get_collection
-from File_handling import read_file_content
+from Connection import get_collection, request_options
+from File_handling import read_file_content, to_model_part
+from Score_cache import get_score_cache, make_cache_key
+from Llm_client import cache_model_name, get_scoring_model
+from Scoring import SCORES_SCHEMA, STRING, STRINGS, object_schema, score_json, scores_complete
+from Single_flight import single_flight
+from Rollups import record_attempt
+from Self_test import ATTEMPTS_COLLECTION, SelfTestDashboard, attempt_record, load_attempts
+from Write_queue import get_write_queue
+from Lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
 
 st.title("📚 Essay Self-Test (SPM Paper 2)")
 st.markdown(
@@ -21,9 +28,17 @@ st.markdown(
     """
 )
 
-# State
-if "self_test_essays" not in st.session_state:
-    st.session_state["self_test_essays"] = []
+# State: seeded once per session from saved attempts, then updated one attempt at a time
+if "self_test_dashboard" not in st.session_state:
+    dash = SelfTestDashboard()
+    if "user" in st.session_state:
+        username = st.session_state["user"]["username"]
+        try:
+            dash = SelfTestDashboard.from_history(*load_attempts(username))
+        except Exception:
+            st.caption("⚠️ Could not load your saved attempts; showing this session only.")
+    st.session_state["self_test_dashboard"] = dash
+dash = st.session_state["self_test_dashboard"]
 
 # --- Practice selector ---
 with st.sidebar:
@@ -37,7 +52,7 @@ with st.sidebar:
     st.caption("Tip: You can paste text, upload a file, or upload an image of your essay.")
 
 # --- AI Setup ---
-get_genai_connection()
+TASK = "self_test"
 
 SYSTEM_PROMPT = (
     "You are an **SPM English Paper 2 examiner**.\n"
@@ -71,44 +86,25 @@ SYSTEM_PROMPT = (
     "- JSON ONLY. Keep bullets short. Choose nearest integer for each lens."
 )
 
-model = genai.GenerativeModel("gemini-1.5-flash", system_instruction=SYSTEM_PROMPT)
+LABEL_SCHEMA = object_schema({"part": STRING, "type": STRING})
+RESPONSE_SCHEMA = object_schema({
+    "intended": LABEL_SCHEMA,
+    "detected": LABEL_SCHEMA,
+    "scores": SCORES_SCHEMA,
+    "feedback": object_schema({"strengths": STRINGS, "weaknesses": STRINGS}),
+    "next_focus": STRINGS,
+    "recommended_part3_choices": STRINGS,
+})
+
+model = get_scoring_model(TASK, SYSTEM_PROMPT)
+MODEL_NAME = cache_model_name(model)
+score_cache = get_score_cache()
 
 # --- Input area ---
 st.subheader("✍️ Submit Your Essay")
 essay_text = st.text_area("Paste your essay here (optional)", height=180, placeholder="Paste your essay text...")
 uploaded_file = st.file_uploader("Or upload a file (txt, docx, pdf, or image)", type=["txt", "doc", "docx", "pdf", "jpg", "jpeg", "png"])
 
-def _safe_parse_json(raw_text: str):
-    s, e = raw_text.find("{"), raw_text.rfind("}") + 1
-    if s == -1 or e <= 0:
-        return None
-    try:
-        return json.loads(raw_text[s:e])
-    except Exception:
-        return None
-
-def _coerce_0_5(x):
-    try:
-        v = int(round(float(x)))
-        return max(0, min(5, v))
-    except Exception:
-        return None
-
-def _fix_scores(scores: dict) -> dict:
-    if not isinstance(scores, dict):
-        return {}
-    out = {}
-    for k in ["content", "organization", "language", "communicative"]:
-        out[k] = _coerce_0_5(scores.get(k))
-    if all(v is not None for v in out.values()):
-        try:
-            total = scores.get("total_out_of_20")
-            total = int(total) if total is not None else sum(out.values())
-        except Exception:
-            total = sum(out.values())
-        out["total_out_of_20"] = max(0, min(20, int(total)))
-    return out
-
 def _label_to_intended(part_label: str, type_label: str):
     p = "Part 1" if part_label.startswith("Part 1") else "Part 2" if part_label.startswith("Part 2") else "Part 3"
     return {"part": p, "type": type_label}
@@ -130,58 +126,68 @@ if st.button("Analyze Essay"):
 
     intended = _label_to_intended(part, subtype)
 
-    with st.spinner("Scoring your essay..."):
-        try:
-            raw = model.generate_content([json.dumps({"intended": intended}), content]).text
-        except Exception as e:
-            st.error(f"Model error: {e}")
+    cache_key = make_cache_key(MODEL_NAME, SYSTEM_PROMPT, [content], extra=intended)
+    data = score_cache.get(cache_key)
+
+    if data is None:
+        with st.spinner("Scoring your essay..."):
+            try:
+                data = single_flight(cache_key, lambda: score_json(
+                    model, [json.dumps({"intended": intended}), to_model_part(content)], scores_path=("scores",),
+                    request_options=request_options(TASK), task=TASK, response_schema=RESPONSE_SCHEMA), timeout=request_options(TASK)["timeout"])
+            except Exception as e:
+                st.error(f"Model error: {e}")
+                st.stop()
+
+        if not data:
+            st.error("⚠️ Could not parse AI response. Please try again.")
             st.stop()
 
-    data = _safe_parse_json(raw)
-    if not data:
-        st.error("⚠️ Could not parse AI response. Please try again.")
-        st.stop()
-
-    # normalize
-    data.setdefault("intended", intended)
-    data.setdefault("detected", {"part": "Mixed", "type": "Mixed"})
-    data.setdefault("scores", {})
-    data["scores"] = _fix_scores(data["scores"])
-    data.setdefault("feedback", {"strengths": [], "weaknesses": []})
-    data.setdefault("next_focus", [])
-    data.setdefault("recommended_part3_choices", [])
+        # normalize
+        data.setdefault("intended", intended)
+        data.setdefault("detected", {"part": "Mixed", "type": "Mixed"})
+        data.setdefault("feedback", {"strengths": [], "weaknesses": []})
+        data.setdefault("next_focus", [])
+        data.setdefault("recommended_part3_choices", [])
+        # a result still missing lenses after the retry is shown but not cached
+        if scores_complete(data.get("scores")):
+            score_cache.put(cache_key, data)
 
     # store attempt
-    st.session_state["self_test_essays"].append({
-        "intended": data["intended"],
-        "detected": data["detected"],
-        "analysis": data,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M")
-    })
+    now = datetime.now()
+    attempt = attempt_record(data, now.strftime("%Y-%m-%d %H:%M"))
+    dash.add(attempt)
 
     # optional DB save
     if "user" in st.session_state:
-        get_collection("user_performance").insert_one({
-            "username": st.session_state["user"]["username"],
-            "self_test": data,
-            "timestamp": datetime.now()
-        })
+        username = st.session_state["user"]["username"]
+        essay_type = f"{attempt['part']} / {attempt['type_of_essay']}"
+        scores = data["scores"]
+        queue = get_write_queue()
+        queue.put(
+            get_collection("user_performance"),
+            {"username": username, "self_test": data, "timestamp": now},
+            on_written=lambda doc_id: record_attempt(username, scores, essay_type, "self_test",
+                                                  attempt_id=doc_id),
+        )
+        queue.put(get_collection(ATTEMPTS_COLLECTION), {"username": username, "attempt": attempt, "timestamp": now})
 
     st.success("✅ Essay analyzed and saved!")
 
 # --- Progress & History ---
-num_essays = len(st.session_state["self_test_essays"])
+num_essays = dash.count
 st.progress(min(num_essays, 5) / 5)
 st.caption(f"Uploaded attempts: **{num_essays}/5**")
 
 if num_essays:
     st.subheader("📄 Your Attempts")
-    for i, item in enumerate(st.session_state["self_test_essays"], 1):
-        a = item["analysis"]
+    if num_essays > len(dash.shown()):
+        st.caption(f"Showing your latest {len(dash.shown())}; all attempts are on the **Performance** page.")
+    for i, a in dash.shown():
         scores = a.get("scores", {})
-        with st.expander(f"Attempt {i} — {item['date']}"):
+        with st.expander(f"Attempt {i} — {a['date']}"):
             st.markdown(
-                f"- **Intended:** {item['intended']['part']} / {item['intended']['type']}\n"
+                f"- **Intended:** {a['intended']['part']} / {a['intended']['type']}\n"
                 f"- **Detected:** {a.get('detected',{}).get('part','—')} / {a.get('detected',{}).get('type','—')}\n"
                 f"- **Scores:** Content {scores.get('content','—')}, Org {scores.get('organization','—')}, "
                 f"Lang {scores.get('language','—')}, Comm {scores.get('communicative','—')} → **Total {scores.get('total_out_of_20','—')}/20**"
@@ -206,27 +212,16 @@ if num_essays:
 # --- Dashboard after 5 ---
 if num_essays >= 5:
     st.subheader("📊 Progress Dashboard")
-    rows = []
-    for idx, item in enumerate(st.session_state["self_test_essays"], 1):
-        s = item["analysis"].get("scores", {})
-        rows.append({
-            "Attempt": idx,
-            "Content": s.get("content", None),
-            "Organization": s.get("organization", None),
-            "Language": s.get("language", None),
-            "Communicative": s.get("communicative", None),
-            "Total": s.get("total_out_of_20", None),
-            "Type": f"{item['intended']['part']} / {item['intended']['type']}"
-        })
-    df = pd.DataFrame(rows)
 
     st.write("### 📈 Score Trends")
-    fig = px.line(df, x="Attempt", y=["Content","Organization","Language","Communicative","Total"], markers=True)
-    st.plotly_chart(fig, use_container_width=True)
+    # figure is cached on the dashboard and rebuilt only after a new attempt
+    st.plotly_chart(dash.trend_figure(), use_container_width=True)
+    if num_essays > len(dash.recent):
+        st.caption(f"Latest {len(dash.recent)} attempts.")
 
     st.write("### 📌 Averages by Intended Type")
-    avg = df.groupby("Type")[["Content","Organization","Language","Communicative","Total"]].mean().round(2).reset_index()
-    st.dataframe(avg, use_container_width=True)
+    # running per-type sums, seeded from saved attempts and updated per attempt
+    st.dataframe(pd.DataFrame(dash.averages()), use_container_width=True, hide_index=True)
 
     st.success("🌟 Keep practising — your consistency builds exam confidence!")
 
@@ -234,6 +229,7 @@ if num_essays >= 5:
 c1, c2 = st.columns(2)
 with c1:
     if st.button("🔄 Start Over (Clear Attempts)"):
-        st.session_state["self_test_essays"] = []; st.rerun()
+        # clears this session's view only; saved attempts stay on the Performance page
+        st.session_state["self_test_dashboard"] = SelfTestDashboard(); st.rerun()
 with c2:
     st.caption("Tip: Use the sidebar to switch Part/Type and generate a new practice task.")
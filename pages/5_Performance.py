@@ -1,76 +1,181 @@
 # pages/5_Performance.py
 import os, sys
-import pandas as pd
 import streamlit as st
+from bson import ObjectId
 
 st.set_page_config(page_title="Performance", page_icon="📊", layout="wide")
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from Connection import get_collection
+from Connection import get_dashboard_collection
 from Authentication import login_required
-from Data_Visualization import display_suggestion, display_user_analysis, display_scores_over_time
+from Data_Visualization import display_suggestion, display_trend_figure, display_user_analysis, scores_trend_figure_json
+from Lazy_imports import lazy_import
+from Rollups import get_rollup, rollup_means
+from Self_test import ATTEMPTS_COLLECTION
+from Data_version import data_version
+
+pd = lazy_import("pandas")
 
 st.write("# Performance 📊")
 
-def get_past_performance(username):
-    return list(get_collection("user_performance").find({"username": username}).sort("timestamp", -1))
+HISTORY_LIMIT = 5000  # most recent attempts on the trend tab (downsampled for plotting)
+PAGE_SIZE = 20        # saved suggestions listed per page
+CACHE_TTL_S = 300     # backstop for writes made by other processes (see Data_version.py)
+TABS = ["Overall Performance", "Latest User Analysis", "Past Suggestions", "Self-Test History"]
+
+# Only what the trend chart needs (covers both saved shapes)
+SCORE_PROJECTION = {
+    "_id": 0,
+    "timestamp": 1,
+    "suggestions.essay_score.scores": 1,
+    "suggestions.essay_evaluation.scores": 1,
+    "self_test.scores": 1,
+}
+SELF_TEST_PROJECTION = {"_id": 0, "attempt.date": 1, "attempt.part": 1, "attempt.type_of_essay": 1,
+                        "attempt.scores": 1}
+
+def get_score_history(username, limit=HISTORY_LIMIT):
+    # uncached: only get_trend_chart reads it, and caches the much smaller figure instead
+    cur = (get_dashboard_collection("user_performance")
+           .find({"username": username}, SCORE_PROJECTION)
+           .sort("timestamp", -1)
+           .limit(limit))
+    return list(cur)
+
+# --- Cached queries ---
+# Keyed by (username, write version): a user's own write bumps the version and
+# misses the cache; other users and repeated reruns hit it.
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=200, show_spinner=False)
+def get_trend_chart(username, version):
+    """(figure JSON, resolution, attempts loaded): the chart is rebuilt only after the user's next write."""
+    history = get_score_history(username)
+    return (*scores_trend_figure_json(history, username), len(history))
+
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=1000, show_spinner=False)
+def get_user_rollup(username, version):
+    return get_rollup(username)
+
+def _suggestion_filter(username):
+    return {"username": username, "suggestions": {"$exists": True}}
+
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=1000, show_spinner=False)
+def count_suggestions(username, version):
+    return get_dashboard_collection("user_performance").count_documents(_suggestion_filter(username))
+
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=1000, show_spinner=False)
+def get_suggestion_page(username, version, page):
+    cur = (get_dashboard_collection("user_performance")
+           .find(_suggestion_filter(username), {"timestamp": 1})
+           .sort("timestamp", -1)
+           .skip(page * PAGE_SIZE)
+           .limit(PAGE_SIZE))
+    return list(cur)
 
-def get_user_analysis_doc(username):
-    return get_collection("user_analysis").find_one({"username": username}, sort=[('_id', -1)])
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=200, show_spinner=False, hash_funcs={ObjectId: str})
+def get_suggestion(doc_id):
+    # saved attempts are never edited, so the id alone is a safe key
+    return get_dashboard_collection("user_performance").find_one({"_id": doc_id}, {"suggestions": 1})
 
-def get_self_tests(username):
-    # If you saved self-tests to DB in 4_Self_Test, fetch them here
-    cur = get_collection("self_test_attempts").find({"username": username}).sort("timestamp", -1)
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=1000, show_spinner=False)
+def get_user_analysis_doc(username, version):
+    return get_dashboard_collection("user_analysis").find_one({"username": username}, sort=[('_id', -1)])
+
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=1000, show_spinner=False)
+def count_self_tests(username, version):
+    return get_dashboard_collection(ATTEMPTS_COLLECTION).count_documents({"username": username})
+
+@st.cache_data(ttl=CACHE_TTL_S, max_entries=1000, show_spinner=False)
+def get_self_test_page(username, version, page):
+    cur = (get_dashboard_collection(ATTEMPTS_COLLECTION)
+           .find({"username": username}, SELF_TEST_PROJECTION)
+           .sort("timestamp", -1)
+           .skip(page * PAGE_SIZE)
+           .limit(PAGE_SIZE))
     return [x["attempt"] for x in cur]
 
+# --- Tabs ---
+# Each tab loads its own data inside a fragment: only the selected tab queries
+# MongoDB, and widgets inside a tab rerun that tab alone.
+@st.fragment
+def overall_tab(username):
+    version = data_version(username, "user_performance")
+    rollup = get_user_rollup(username, version)
+    if rollup:
+        means = rollup_means(rollup)["overall"]
+        totals = [x["total"] for x in rollup.get("last_totals", [])]
+        cols = st.columns(6)
+        cols[0].metric("Attempts", rollup.get("count", 0))
+        for col, (key, label) in zip(cols[1:], [("content", "Content"), ("organization", "Organization"),
+                                                ("language", "Language"), ("communicative", "Communicative")]):
+            col.metric(f"Avg {label}", means.get(key, "—"))
+        delta = round(totals[-1] - totals[-2], 1) if len(totals) > 1 else None
+        cols[5].metric("Latest Total (/20)", totals[-1] if totals else "—", delta)
+    fig_json, resolution, loaded = get_trend_chart(username, version)
+    if loaded:
+        display_trend_figure(fig_json, resolution)
+        if loaded == HISTORY_LIMIT:
+            st.caption(f"Showing your latest {HISTORY_LIMIT} attempts.")
+    else:
+        st.info("No saved suggestions yet. Submit an essay in **Essay Suggestions**.")
+
+@st.fragment
+def user_analysis_tab(username):
+    user_analysis = get_user_analysis_doc(username, data_version(username, "user_analysis"))
+    if user_analysis:
+        st.write("### Latest User Analysis")
+        display_user_analysis(user_analysis['user_info'])
+    else:
+        st.info("No user analysis available. Try **User Analysis** page.")
+
+@st.fragment
+def suggestions_tab(username):
+    version = data_version(username, "user_performance")
+    total = count_suggestions(username, version)
+    if total:
+        # Page through labels only; load the full document for the one selected
+        n_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        page = 0
+        if n_pages > 1:
+            page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1) - 1
+        items = get_suggestion_page(username, version, page)
+        labels = {f"{page * PAGE_SIZE + i + 1} - {d['timestamp']}": d["_id"] for i, d in enumerate(items)}
+        selected = st.selectbox("Select a saved suggestion", list(labels))
+        doc = get_suggestion(labels[selected]) if selected else None
+        if doc:
+            display_suggestion(doc["suggestions"])
+    else:
+        st.info("No past suggestions available.")
+
+@st.fragment
+def self_test_tab(username):
+    version = data_version(username, ATTEMPTS_COLLECTION)
+    total = count_self_tests(username, version)
+    if total:
+        st.write(f"Found **{total}** self-test attempts saved.")
+        n_pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        page = 0
+        if n_pages > 1:
+            page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1,
+                                   key="self_test_page") - 1
+        rows = []
+        for i, e in enumerate(get_self_test_page(username, version, page), page * PAGE_SIZE + 1):
+            s = e.get("scores", {})
+            rows.append({
+                "Attempt": i, "Date": e.get("date","—"), "Part": e.get("part","—"), "Type": e.get("type_of_essay","—"),
+                "Content": s.get("content"), "Organization": s.get("organization"),
+                "Language": s.get("language"), "Communicative": s.get("communicative"),
+                "Total(20)": s.get("total_out_of_20")
+            })
+        df = pd.DataFrame(rows)
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    else:
+        st.info("No self-test attempts in the database yet.")
+
+TAB_VIEWS = dict(zip(TABS, [overall_tab, user_analysis_tab, suggestions_tab, self_test_tab]))
+
 @login_required
 def main():
-    tabs = st.tabs(["Overall Performance", "Latest User Analysis", "Past Suggestions", "Self-Test History"])
-
-    username = st.session_state["user"]["username"]
-    past_performance = get_past_performance(username)
-    user_analysis = get_user_analysis_doc(username)
-    self_tests = get_self_tests(username)
-
-    with tabs[0]:
-        if past_performance:
-            df = pd.DataFrame(past_performance)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            display_scores_over_time(df, username)
-        else:
-            st.info("No saved suggestions yet. Submit an essay in **Essay Suggestions**.")
-
-    with tabs[1]:
-        if user_analysis:
-            st.write("### Latest User Analysis")
-            display_user_analysis(user_analysis['user_info'])
-        else:
-            st.info("No user analysis available. Try **User Analysis** page.")
-
-    with tabs[2]:
-        if past_performance:
-            # Select and render one suggestion
-            label_list = [f"{i+1} - {past_performance[i]['timestamp']}" for i in range(len(past_performance))]
-            selected = st.selectbox("Select a saved suggestion", label_list)
-            idx = int(selected.split(" - ")[0]) - 1
-            display_suggestion(past_performance[idx]["suggestions"])
-        else:
-            st.info("No past suggestions available.")
-
-    with tabs[3]:
-        if self_tests:
-            st.write(f"Found **{len(self_tests)}** self-test attempts saved.")
-            rows = []
-            for i, e in enumerate(self_tests, 1):
-                s = e.get("scores", {})
-                rows.append({
-                    "Attempt": i, "Date": e.get("date","—"), "Part": e.get("part","—"), "Type": e.get("type_of_essay","—"),
-                    "Content": s.get("content"), "Organization": s.get("organization"),
-                    "Language": s.get("language"), "Communicative": s.get("communicative"),
-                    "Total(20)": s.get("total_out_of_20")
-                })
-            df = pd.DataFrame(rows)
-            st.dataframe(df, use_container_width=True, hide_index=True)
-        else:
-            st.info("No self-test attempts in the database yet.")
+    # st.tabs would run every tab's body on each rerun; render only the selected one
+    tab = st.radio("View", TABS, horizontal=True, label_visibility="collapsed", key="performance_tab")
+    TAB_VIEWS[tab](st.session_state["user"]["username"])
 
 main()
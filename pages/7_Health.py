@@ -0,0 +1,76 @@
+# pages/7_Health.py
+import json, os, sys
+import streamlit as st
+
+st.set_page_config(page_title="Health", page_icon="🩺", layout="wide")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from Authentication import login_required
+from Health import HEALTH_TTL_S, health_report
+from Llm_metrics import llm_call_report
+from Lazy_imports import lazy_import
+
+px = lazy_import("plotly.express")
+
+st.write("# System Health 🩺")
+
+def admin_users() -> set[str]:
+    # ADMIN_USERS = ["alice", "bob"]  (or a comma-separated string) in secrets.toml
+    raw = st.secrets.get("ADMIN_USERS", [])
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    return {u.strip() for u in raw if str(u).strip()}
+
+@login_required
+def main():
+    username = st.session_state["user"]["username"]
+    if username not in admin_users():
+        st.error("🔒 This page is for administrators (see `ADMIN_USERS` in secrets).")
+        st.stop()
+
+    force = st.button("🔄 Re-check now")
+    report = health_report(force=force)
+    st.caption(f"Checked at {report['checked_at']} · results are reused for {HEALTH_TTL_S:.0f}s")
+
+    mongo = report["checks"]["mongo"]
+    cols = st.columns(4)
+    cols[0].metric("MongoDB", "✅ up" if mongo["ok"] else "❌ down",
+                   f"{mongo['latency_ms']} ms ping", delta_color="off")
+    cols[1].metric("Gemini", "✅ usable" if report["gemini_usable"] else "❌ failing",
+                   f"{report['checks']['gemini']['recent_calls']} recent calls", delta_color="off")
+    cols[2].metric("OpenAI", "configured" if report["openai_configured"] else "not configured")
+    cols[3].metric("Write queue depth", report["components"].get("write_queue", {}).get("depth", "—"))
+    if mongo["error"]:
+        st.caption(f"⚠️ MongoDB: {mongo['error']}")
+
+    st.write("### Latency (last 15 minutes)")
+    latency = report["latency"]
+    if latency:
+        st.dataframe(
+            [{"Call": name, **{k: s[k] for k in ("count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms")}}
+             for name, s in latency.items()],
+            use_container_width=True, hide_index=True)
+        name = st.selectbox("Histogram", list(latency))
+        buckets = latency[name]["buckets"]
+        fig = px.bar(x=list(buckets), y=list(buckets.values()), labels={"x": "latency", "y": "calls"})
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No calls recorded in this process yet.")
+
+    st.write("### Model calls by page")
+    hours = st.selectbox("Window", [1, 24, 24 * 7], index=1, format_func=lambda h: f"last {h} h")
+    calls = llm_call_report(hours=hours) if mongo["ok"] else None
+    if calls is None:
+        st.info("Model calls are stored in MongoDB, which is down.")
+    elif calls.empty:
+        st.info("No model calls recorded in this window.")
+    else:
+        st.dataframe(calls, use_container_width=True, hide_index=True)
+
+    st.write("### Components")
+    for name, stats in report["components"].items():
+        with st.expander(name):
+            st.json(stats)
+
+    st.download_button("⬇️ Download JSON", json.dumps(report, indent=2, default=str), file_name="health.json", mime="application/json")
+
+main()
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import os
+import sys
+
+# the app's modules live at the repo root (pages put it on sys.path the same way)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: spawns interpreters or servers; deselect with -m 'not slow'")
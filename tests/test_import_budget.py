@@ -0,0 +1,15 @@
+# tests/test_import_budget.py
+import os
+
+import pytest
+
+from Import_budget import DEFAULT_BUDGET_MS, report
+
+BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS))
+
+@pytest.mark.slow
+def test_pages_import_within_budget():
+    results, failures = report(BUDGET_MS)
+    assert failures == []
+    slowest = max(results.items(), key=lambda kv: kv[1]["total_ms"])
+    assert slowest[1]["total_ms"] <= BUDGET_MS, slowest
@@ -0,0 +1,46 @@
+# tests/test_llm_client.py
+import time
+
+import Llm_client
+from Health import observe
+from Llm_client import GeminiProvider, HedgedModel, Reply, hedge_stats
+
+class StubProvider:
+    def __init__(self, name: str, delay_s: float, metric: str | None = None):
+        self.name, self.delay_s = name, delay_s
+        self.metric = metric or f"stub:{name}"
+        self.model_name = name
+
+    def generate(self, contents, **_):
+        time.sleep(self.delay_s)
+        return Reply('{"scores": {}}', self.name, self.model_name)
+
+def test_slow_primary_is_hedged_and_the_faster_reply_wins():
+    before = hedge_stats()
+    model = HedgedModel(StubProvider("primary", 1.0), StubProvider("secondary", 0.05), hedge_after_s=0.05)
+    started = time.perf_counter()
+    reply = model.generate_content(["essay"])
+    assert reply.provider == "secondary"
+    assert time.perf_counter() - started < 0.5
+    after = hedge_stats()
+    assert after["hedges"] == before["hedges"] + 1
+    assert after["secondary_wins"] == before["secondary_wins"] + 1
+
+def test_fast_primary_is_not_hedged():
+    before = hedge_stats()
+    model = HedgedModel(StubProvider("primary", 0.0), StubProvider("secondary", 0.0), hedge_after_s=0.5)
+    assert model.generate_content(["essay"]).provider == "primary"
+    assert hedge_stats()["hedges"] == before["hedges"]
+
+def test_deadline_ignores_chat_latency_on_the_same_model(monkeypatch):
+    monkeypatch.setattr(Llm_client, "HEDGE_FLOOR_S", 0.0)
+
+    class Model:
+        model_name = "models/gemini-test"
+
+    primary = GeminiProvider(Model(), "self_test")
+    for _ in range(Llm_client.HEDGE_MIN_SAMPLES):
+        observe("gemini:gemini-test", 30_000)   # long chat streams under the bare model name
+        observe(primary.metric, 800)            # scoring calls for this task
+    deadline = HedgedModel(primary, StubProvider("secondary", 0.0)).hedge_deadline()
+    assert deadline == 0.8
@@ -0,0 +1,56 @@
+# tests/test_migrations.py
+"""
+Migrations against mongomock, plus the explain-plan check against a real
+mongod (mongomock has no query planner): set MONGODB_TEST_URI, default
+mongodb://localhost:27017; skipped when nothing is listening.
+"""
+import os
+import uuid
+
+import mongomock
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from Migrations import MIGRATIONS, applied_versions, collection_scans, run_migrations
+
+TEST_URI = os.environ.get("MONGODB_TEST_URI", "mongodb://localhost:27017")
+
+@pytest.fixture
+def mock_db():
+    return mongomock.MongoClient()["essay_assistant_db"]
+
+@pytest.fixture
+def mongod_db():
+    client = MongoClient(TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"no mongod at {TEST_URI}")
+    name = f"test_migrations_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
+
+def test_a_failed_migration_does_not_hold_back_the_others(mock_db):
+    # mongomock can't create capped collections, so migration 4 fails
+    problems = run_migrations(mock_db)
+    assert [p.split(" ")[1] for p in problems] == ["4"]
+    assert applied_versions(mock_db) == {1, 2, 3}
+    assert "username_timestamp" in mock_db["user_performance"].index_information()
+
+    # applied migrations are not re-run; the failed one is retried
+    assert len(run_migrations(mock_db)) == 1
+
+def test_duplicates_are_named_and_only_block_their_own_index(mock_db):
+    mock_db["users"].insert_many([{"username": "amy", "email": "a@x"}, {"username": "amy", "email": "b@x"}])
+    problems = run_migrations(mock_db)
+    assert any("duplicate users.username values ['amy']" in p for p in problems)
+    assert 1 not in applied_versions(mock_db)
+    assert "email_unique" in mock_db["users"].index_information()
+    assert {2, 3} <= applied_versions(mock_db)
+
+def test_hot_queries_use_indexes(mongod_db):
+    assert run_migrations(mongod_db) == []
+    assert applied_versions(mongod_db) == {v for v, _, _ in MIGRATIONS}
+    assert collection_scans(mongod_db) == []
@@ -0,0 +1,38 @@
+# tests/test_rollups.py
+from datetime import datetime
+
+import mongomock
+import pytest
+import streamlit as st
+
+SCORES = {"content": 3, "organization": 3, "language": 3, "communicative": 3, "total_out_of_20": 12}
+
+@pytest.fixture
+def db(monkeypatch):
+    st.secrets._secrets = {"MONGODB_URI": "mongodb://stub", "GOOGLE_API_KEY": "stub"}
+    import Connection
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(Connection, "get_mongo_client", lambda: client)
+    return client["essay_assistant_db"]
+
+def _save(db, username="ann"):
+    return db["user_performance"].insert_one(
+        {"username": username, "self_test": {"scores": SCORES}, "timestamp": datetime.now()}).inserted_id
+
+def test_rebuild_between_insert_and_callback_counts_once(db):
+    from Rollups import get_rollup, record_attempt
+    record_attempt("ann", SCORES, "T", "self_test", attempt_id=_save(db))
+    late = _save(db)
+    db["user_rollups"].delete_many({})               # e.g. a user whose rollup is not built yet
+    assert get_rollup("ann")["count"] == 2           # the Performance page rebuilds before the callback runs
+    record_attempt("ann", SCORES, "T", "self_test", attempt_id=late)
+    assert db["user_rollups"].find_one({"_id": "ann"})["count"] == 2
+
+def test_each_attempt_is_counted_once(db):
+    from Rollups import record_attempt
+    ids = [_save(db) for _ in range(3)]
+    for attempt_id in ids + ids:   # the first call rebuilds, repeats are no-ops
+        record_attempt("ann", SCORES, "T", "self_test", attempt_id=attempt_id)
+    doc = db["user_rollups"].find_one({"_id": "ann"})
+    assert doc["count"] == 3
+    assert doc["sums"]["total_out_of_20"] == 36